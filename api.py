@@ -0,0 +1,269 @@
+"""JSON query API served next to the Gradio UI.
+
+Programmatic consumers get the rows and statistics behind the UI without
+chart rendering, HTML or the table's row cap:
+
+    GET /api/records   matching rows as JSON (default) or NDJSON (format=ndjson)
+    GET /api/stats     record count, distinct and most common values
+    GET /api/export    every matching row as a streamed CSV, NDJSON or Parquet download
+    POST /api/check    lab sample results (CSV body) checked against the limits, streamed back as CSV
+    GET /api/match     best matching contaminants or commodities for free-text names
+
+All take the same filters as query parameters: contaminant, commodity and
+level_type (repeatable, raw column values), search with search_mode (exact
+substring, or ranked: the best matches, typos allowed), and level_min /
+level_max / level_unit. /api/records and /api/export also take fields
+(comma-separated column names). /api/records pages with limit and cursor;
+the cursor of the next page is returned as next_cursor (JSON) or the
+X-Next-Cursor header (NDJSON). /api/check takes the sample CSV described in
+compliance.py and repeatable only=<status> to return just those results.
+/api/match takes repeatable name, column (Contaminant or Commodity), k and
+min_score.
+Responses carry an ETag derived from the
+dataset version and the query, so unchanged results are answered with
+304 Not Modified, and large responses are gzip-encoded for clients that
+accept it.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+
+from aggregation import CountCube, selection_stats
+from compliance import CHUNK_ROWS, STATUSES, LimitIndex, check_chunks, sample_columns
+from export import EXPORT_MEDIA_TYPES, export_formats, stream_export, stream_ndjson
+from name_matcher import MATCH_COLUMNS
+
+# Page size bounds for /api/records
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = int(os.environ.get('API_MAX_LIMIT', '100000'))
+
+# Rows serialized per chunk of an NDJSON page
+NDJSON_CHUNK_ROWS = 5000
+
+# Bytes of a /api/check body kept in memory before it is spooled to disk
+CHECK_SPOOL_BYTES = int(os.environ.get('CHECK_SPOOL_MB', '16')) * 1024 * 1024
+
+
+def query_filters(
+    contaminant: Optional[List[str]] = Query(None),
+    commodity: Optional[List[str]] = Query(None),
+    level_type: Optional[List[str]] = Query(None),
+    search: Optional[str] = None,
+    search_mode: str = Query('exact', pattern='^(exact|ranked)$'),
+    level_min: Optional[float] = None,
+    level_max: Optional[float] = None,
+    level_unit: str = 'ppm',
+):
+    """Filter query parameters as keyword arguments for Dataset.select"""
+    return {
+        'filters': {
+            'Contaminant': contaminant,
+            'Commodity': commodity,
+            'Contaminant Level Type': level_type,
+        },
+        'search_term': search,
+        'search_mode': search_mode,
+        'level_min': level_min,
+        'level_max': level_max,
+        'level_unit': level_unit,
+    }
+
+
+def query_etag(version, request):
+    """ETag for a query against one dataset version, independent of parameter order"""
+    query = sorted(request.query_params.multi_items())
+    digest = hashlib.sha256(json.dumps(query).encode('utf-8')).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def not_modified(request, etag):
+    tags = [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]
+    return etag in tags or '*' in tags
+
+
+def projected_columns(dataset, fields):
+    """Columns named by a fields parameter, or the source columns without one"""
+    if not fields:
+        return dataset.source_columns
+    columns = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [column for column in columns if column not in dataset.columns]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    return columns
+
+
+def encode_cursor(version, row_id):
+    return base64.urlsafe_b64encode(f"{version}:{row_id}".encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, version):
+    """Row id a cursor points after; cursors only stay valid for their dataset version"""
+    try:
+        cursor_version, row_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii').split(':')
+        row_id = int(row_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    if cursor_version != version:
+        raise HTTPException(410, "The dataset changed since this cursor was issued; start again without a cursor")
+    return row_id
+
+
+def create_api(current_dataset):
+    """FastAPI app for the query API; ``current_dataset`` returns the Dataset to serve"""
+    api = FastAPI(title="Food Contaminants API")
+    api.add_middleware(GZipMiddleware, minimum_size=1024)
+
+    @api.get('/records')
+    def records(
+        request: Request,
+        query: dict = Depends(query_filters),
+        fields: Optional[str] = None,
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+        cursor: Optional[str] = None,
+        format: str = Query('json', pattern='^(json|ndjson)$'),
+    ):
+        # The whole response comes from one dataset, even if a reload swaps in a newer one
+        dataset = current_dataset()
+        etag = query_etag(dataset.version, request)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        columns = projected_columns(dataset, fields)
+        row_ids = dataset.select(**query)
+        start = 0
+        if cursor and query['search_mode'] == 'ranked':
+            # Ranked rows come best first, not in row order
+            found = np.flatnonzero(row_ids == decode_cursor(cursor, dataset.version))
+            if not len(found):
+                raise HTTPException(400, "Invalid cursor")
+            start = int(found[0]) + 1
+        elif cursor:
+            start = int(np.searchsorted(row_ids, decode_cursor(cursor, dataset.version), side='right'))
+        page_ids = row_ids[start:start + limit]
+        next_cursor = None
+        if start + limit < len(row_ids):
+            next_cursor = encode_cursor(dataset.version, int(page_ids[-1]))
+
+        headers = {'ETag': etag, 'X-Total-Count': str(len(row_ids))}
+        if format == 'ndjson':
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+            return StreamingResponse(stream_ndjson(dataset.store, page_ids, columns, NDJSON_CHUNK_ROWS),
+                                     media_type='application/x-ndjson', headers=headers)
+
+        records_json = dataset.take(page_ids, columns).to_json(orient='records', force_ascii=False)
+        envelope = json.dumps({
+            'version': dataset.version,
+            'total': len(row_ids),
+            'next_cursor': next_cursor,
+        }, ensure_ascii=False)
+        body = envelope[:-1] + ', "records": ' + records_json + '}'
+        return Response(body, media_type='application/json', headers=headers)
+
+    @api.get('/stats')
+    def stats(request: Request, query: dict = Depends(query_filters)):
+        dataset = current_dataset()
+        etag = query_etag(dataset.version, request)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        result = selection_stats(CountCube(dataset.engine, dataset.select(**query)))
+        result['version'] = dataset.version
+        return Response(json.dumps(result, ensure_ascii=False), media_type='application/json', headers={'ETag': etag})
+
+    @api.get('/export')
+    def export(
+        request: Request,
+        query: dict = Depends(query_filters),
+        fields: Optional[str] = None,
+        format: str = 'csv',
+    ):
+        if format not in export_formats():
+            raise HTTPException(400, f"Unsupported format {format!r}; available: {', '.join(export_formats())}")
+        dataset = current_dataset()
+        etag = query_etag(dataset.version, request)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+
+        columns = projected_columns(dataset, fields)
+        row_ids = dataset.select(**query)
+        headers = {
+            'ETag': etag,
+            'X-Total-Count': str(len(row_ids)),
+            'Content-Disposition': f'attachment; filename="contaminant-levels-{dataset.version}.{format}"',
+        }
+        return StreamingResponse(stream_export(dataset.store, row_ids, columns, format),
+                                 media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+    # Limit index of the dataset version last checked against
+    limit_index = {}
+    def limits_for(dataset):
+        if limit_index.get('version') != dataset.version:
+            limit_index.update(version=dataset.version, limits=LimitIndex.from_dataset(dataset))
+        return limit_index['limits']
+
+    @api.post('/check')
+    async def check(request: Request, only: Optional[List[str]] = Query(None)):
+        unknown = [status for status in only or [] if status not in STATUSES]
+        if unknown:
+            raise HTTPException(400, f"Unknown statuses: {', '.join(unknown)}; available: {', '.join(STATUSES)}")
+        # Spool the body instead of buffering it; it moves to disk past CHECK_SPOOL_BYTES
+        upload = UploadFile(tempfile.SpooledTemporaryFile(max_size=CHECK_SPOOL_BYTES))
+        try:
+            async for chunk in request.stream():
+                await upload.write(chunk)
+            await upload.seek(0)
+            # Parsing and building the limit index block, so they run off the event loop
+            dataset, limits, chunks = await run_in_threadpool(read_samples, upload.file)
+        except BaseException:
+            await upload.close()
+            raise
+        return StreamingResponse((text for text, _ in check_chunks(chunks, limits, statuses=only)),
+                                 media_type='text/csv; charset=utf-8', headers={'X-Dataset-Version': dataset.version},
+                                 background=BackgroundTask(upload.close))
+
+    def read_samples(file):
+        """(dataset, limit index, sample chunks) for a spooled /check body; 400 if it is not a sample CSV"""
+        try:
+            sample_columns(pd.read_csv(file, nrows=0))
+        except (ValueError, pd.errors.EmptyDataError) as e:
+            raise HTTPException(400, str(e))
+        file.seek(0)
+        dataset = current_dataset()
+        limits = limits_for(dataset)
+        chunks = pd.read_csv(file, dtype=str, keep_default_na=False, na_values=[''], chunksize=CHUNK_ROWS)
+        return dataset, limits, chunks
+
+    @api.get('/match')
+    def match(
+        name: List[str] = Query(...),
+        column: str = 'Commodity',
+        k: int = Query(5, ge=1, le=50),
+        min_score: float = Query(0.0, ge=0.0, le=1.0),
+    ):
+        if column not in MATCH_COLUMNS:
+            raise HTTPException(400, f"Unknown column {column!r}; available: {', '.join(MATCH_COLUMNS)}")
+        dataset = current_dataset()
+        matcher = dataset.name_matcher(column)
+        return {
+            'version': dataset.version,
+            'matches': [
+                {'name': text, 'candidates': [{'value': value, 'score': score}
+                                               for value, score in matcher.match(text, k) if score >= min_score]}
+                for text in name
+            ],
+        }
+
+    return api
@@ -1,6 +1,11 @@
 // Global variables
 let allData = [];
 let filteredData = [];
+let summary = null;
+let filtersActive = false;
+
+// Where static_export.py writes the precompiled data shards
+const SHARD_DIR = 'data/static';
 
 // DOM elements
 const contaminantFilter = document.getElementById('contaminant-filter');
@@ -13,21 +18,15 @@ const chartContainer = document.getElementById('chart-container');
 // Load and process data
 async function loadData() {
     try {
-        const response = await fetch('data/contaminant-levels.csv');
-        const csvText = await response.text();
-        
-        // Parse CSV
-        const rows = csvText.split('\n');
-        const headers = rows[0].split(',').map(h => h.trim());
-        
-        allData = rows.slice(1).filter(row => row.trim() !== '').map(row => {
-            const values = row.split(',').map(v => v.trim());
-            const rowData = {};
-            headers.forEach((header, index) => {
-                rowData[header] = values[index] || '';
-            });
-            return rowData;
-        });
+        // Prefer the precompiled shards built by static_export.py; parse the raw CSV without them
+        const shards = await loadShards();
+        if (shards) {
+            allData = decodeRows(shards.rows);
+            summary = shards.summary;
+        } else {
+            const response = await fetch('data/contaminant-levels.csv');
+            allData = parseCsv(await response.text());
+        }
         
         // Initialize filters and data display
         initializeFilters();
@@ -41,21 +40,105 @@ async function loadData() {
     }
 }
 
+// Fetch the shard manifest and the content-hashed shards it names, or null if they were not built
+async function loadShards() {
+    const response = await fetch(`${SHARD_DIR}/manifest.json`, { cache: 'no-cache' });
+    if (!response.ok) return null;
+    const manifest = await response.json();
+    
+    const [rows, shardSummary] = await Promise.all(
+        [manifest.shards.rows, manifest.shards.summary].map(
+            file => fetch(`${SHARD_DIR}/${file}`).then(r => r.json())
+        )
+    );
+    return { rows, summary: shardSummary };
+}
+
+// Expand dictionary-encoded columns into one object per row
+function decodeRows(encoded) {
+    const { columns, dictionaries, codes } = encoded;
+    const rows = new Array(encoded.rows);
+    for (let i = 0; i < encoded.rows; i++) {
+        const rowData = {};
+        columns.forEach((column, c) => {
+            rowData[column] = dictionaries[c][codes[c][i]];
+        });
+        rows[i] = rowData;
+    }
+    return rows;
+}
+
+// Parse CSV text into row objects, honouring quoted fields with commas, quotes and newlines
+function parseCsv(csvText) {
+    const records = [];
+    let record = [];
+    let field = '';
+    let quoted = false;
+    
+    for (let i = 0; i < csvText.length; i++) {
+        const char = csvText[i];
+        if (quoted) {
+            if (char === '"' && csvText[i + 1] === '"') {
+                field += '"';
+                i++;
+            } else if (char === '"') {
+                quoted = false;
+            } else {
+                field += char;
+            }
+        } else if (char === '"') {
+            quoted = true;
+        } else if (char === ',') {
+            record.push(field);
+            field = '';
+        } else if (char === '\n' || char === '\r') {
+            if (char === '\r' && csvText[i + 1] === '\n') i++;
+            record.push(field);
+            records.push(record);
+            record = [];
+            field = '';
+        } else {
+            field += char;
+        }
+    }
+    if (field !== '' || record.length > 0) {
+        record.push(field);
+        records.push(record);
+    }
+    
+    const headers = records[0].map(h => h.trim());
+    return records.slice(1).filter(values => values.join('').trim() !== '').map(values => {
+        const rowData = {};
+        headers.forEach((header, index) => {
+            rowData[header] = (values[index] || '').trim();
+        });
+        return rowData;
+    });
+}
+
 // Initialize filter dropdowns
 function initializeFilters() {
-    const contaminants = new Set();
-    const commodities = new Set();
-    const levelTypes = new Set();
-    
-    allData.forEach(item => {
-        contaminants.add(item.Contaminant);
-        commodities.add(item.Commodity);
-        levelTypes.add(item['Contaminant Level Type']);
-    });
-    
-    populateFilter(contaminantFilter, contaminants);
-    populateFilter(commodityFilter, commodities);
-    populateFilter(levelTypeFilter, levelTypes);
+    if (summary) {
+        // Option lists come precomputed as [value, count] pairs
+        const values = column => summary.options[column].map(([value]) => value);
+        populateFilter(contaminantFilter, values('Contaminant'));
+        populateFilter(commodityFilter, values('Commodity'));
+        populateFilter(levelTypeFilter, values('Contaminant Level Type'));
+    } else {
+        const contaminants = new Set();
+        const commodities = new Set();
+        const levelTypes = new Set();
+        
+        allData.forEach(item => {
+            contaminants.add(item.Contaminant);
+            commodities.add(item.Commodity);
+            levelTypes.add(item['Contaminant Level Type']);
+        });
+        
+        populateFilter(contaminantFilter, contaminants);
+        populateFilter(commodityFilter, commodities);
+        populateFilter(levelTypeFilter, levelTypes);
+    }
     
     // Add event listeners for filters
     contaminantFilter.addEventListener('change', applyFilters);
@@ -81,6 +164,7 @@ function applyFilters() {
     const commodityValue = commodityFilter.value;
     const levelTypeValue = levelTypeFilter.value;
     const searchValue = searchInput.value.toLowerCase();
+    filtersActive = Boolean(contaminantValue || commodityValue || levelTypeValue || searchValue);
     
     filteredData = allData.filter(item => {
         // Apply dropdown filters
@@ -132,16 +216,21 @@ function renderVisualization() {
         return;
     }
     
-    // Group by contaminant (simplified example)
-    const contaminantCounts = {};
-    filteredData.forEach(item => {
-        const contaminant = item.Contaminant;
-        contaminantCounts[contaminant] = (contaminantCounts[contaminant] || 0) + 1;
-    });
-    
-    const chartData = Object.entries(contaminantCounts)
-        .map(([name, value]) => ({ name, value }))
-        .sort((a, b) => b.value - a.value);
+    // Group by contaminant (simplified example); the unfiltered counts come precomputed
+    let chartData;
+    if (summary && !filtersActive) {
+        chartData = summary.contaminant_counts.map(([name, value]) => ({ name, value }));
+    } else {
+        const contaminantCounts = {};
+        filteredData.forEach(item => {
+            const contaminant = item.Contaminant;
+            contaminantCounts[contaminant] = (contaminantCounts[contaminant] || 0) + 1;
+        });
+        
+        chartData = Object.entries(contaminantCounts)
+            .map(([name, value]) => ({ name, value }))
+            .sort((a, b) => b.value - a.value);
+    }
     
     // Simple D3 bar chart
     const margin = { top: 20, right: 20, bottom: 100, left: 50 };
@@ -0,0 +1,79 @@
+"""Compare FilterEngine selection against the old copy-and-mask filtering.
+
+The CSV is replicated up to each table size with a per-replica suffix on
+Contaminant and Commodity, so the benchmark selection (values from the
+first replica) returns the same number of rows at every size.
+
+Run from the repository root:
+
+    python benchmarks/filter_engine_bench.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filter_engine import FilterEngine
+
+SIZES = [10_000, 100_000, 1_000_000]
+REPEATS = 20
+
+
+def scaled_frame(base, n_rows):
+    replicas = -(-n_rows // len(base))
+    df = pd.concat([base] * replicas, ignore_index=True).head(n_rows)
+    suffix = pd.Series(np.repeat(np.arange(replicas), len(base))[:n_rows]).astype(str)
+    for column in ['Contaminant', 'Commodity']:
+        df[column] = df[column].where(suffix == '0', df[column] + ' #' + suffix)
+    return df
+
+
+def pandas_filter(df, filters):
+    """The per-request filtering filter_data used before the engine existed"""
+    filtered_df = df.copy()
+    for column, values in filters.items():
+        filtered_df = filtered_df[filtered_df[column].isin(values)]
+    return filtered_df
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000, result
+
+
+def main():
+    base = pd.read_csv('data/contaminant-levels.csv')
+    base.columns = base.columns.str.strip()
+    for col in base.columns:
+        if base[col].dtype == 'object':
+            base[col] = base[col].str.strip()
+
+    filters = {
+        'Contaminant': base['Contaminant'].value_counts().index[:3].tolist(),
+        'Contaminant Level Type': base['Contaminant Level Type'].value_counts().index[:2].tolist(),
+    }
+
+    print(f"{'rows':>10} {'build ms':>10} {'pandas ms':>10} {'engine ms':>10} {'matches':>8}")
+    for n_rows in SIZES:
+        df = scaled_frame(base, n_rows)
+        start = time.perf_counter()
+        engine = FilterEngine(df)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        pandas_ms, expected = timed(lambda: pandas_filter(df, filters))
+        engine_ms, result = timed(lambda: df.take(engine.select(filters)))
+        assert result.index.equals(expected.index)
+
+        print(f"{n_rows:>10} {build_ms:>10.1f} {pandas_ms:>10.2f} {engine_ms:>10.2f} {len(result):>8}")
+
+
+if __name__ == '__main__':
+    main()
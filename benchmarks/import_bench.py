@@ -0,0 +1,55 @@
+"""Startup cost of the headless core versus the Gradio app.
+
+Each module is imported in a fresh interpreter, REPEATS times, and the
+median wall time is reported, together with whether gradio and matplotlib
+ended up imported. "core + first query" also loads the dataset and runs
+one filter, which is what a batch job pays before its first result.
+
+Run from the repository root:
+
+    python benchmarks/import_bench.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPEATS = 5
+
+CASES = [
+    ('import core', 'import core'),
+    ('core + first query', 'import core; core.filter_data(["Lead"], None, None, "", None, None)'),
+    ('import gradio_app', 'import gradio_app'),
+]
+
+TIMER = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+print(json.dumps([time.perf_counter() - start, 'gradio' in sys.modules, 'matplotlib' in sys.modules]))
+"""
+
+
+def startup(code):
+    """(seconds, gradio imported, matplotlib imported) in a fresh interpreter"""
+    env = dict(os.environ, RELOAD_INTERVAL_S='0')
+    output = subprocess.run([sys.executable, '-c', TIMER.format(code=code)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    print(f"{'case':<20} {'median s':>9} {'gradio':>7} {'matplotlib':>11}")
+    for name, code in CASES:
+        runs = [startup(code) for _ in range(REPEATS)]
+        seconds = np.median([run[0] for run in runs])
+        _, gradio, matplotlib = runs[-1]
+        print(f"{name:<20} {seconds:>9.2f} {str(gradio):>7} {str(matplotlib):>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Throughput, per-name latency and accuracy of the name matcher.
+
+Noisy names are made from the dataset's own values: a part a value lists
+("frozen ackee"), sometimes with a typo or an extra qualifier ("organic
+frozen acke"). Each distinct name is matched once with its latency
+recorded, and the whole batch is classified with ``classify`` to get the
+rate a bulk job sees. A name counts as found when its source value is
+among the top k matches.
+
+Run from the repository root:
+
+    python benchmarks/matcher_bench.py --names 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core
+from name_matcher import MATCH_COLUMNS, value_phrases
+
+QUALIFIERS = ['organic', 'frozen', 'canned', 'dried', 'imported', 'raw', 'whole', 'sliced']
+
+
+def typo(word, rng):
+    """The word with one character dropped, doubled or swapped with the next"""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def noisy_names(values, n, seed=0):
+    """(name, source value) pairs: a phrase of a random value, with a typo or qualifier now and then"""
+    rng = random.Random(seed)
+    phrases = [(value, [' '.join(phrase) for phrase in value_phrases(value)]) for value in values]
+    names = []
+    for _ in range(n):
+        value, options = rng.choice(phrases)
+        words = rng.choice(options).split()
+        if rng.random() < 0.3:
+            i = rng.randrange(len(words))
+            words[i] = typo(words[i], rng)
+        if rng.random() < 0.3:
+            words.insert(0, rng.choice(QUALIFIERS))
+        names.append((' '.join(words), value))
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the free-text name matcher")
+    parser.add_argument('--names', type=int, default=100_000, help="names per column (default: %(default)s)")
+    parser.add_argument('-k', type=int, default=5, help="matches per name (default: %(default)s)")
+    args = parser.parse_args()
+
+    dataset = core.current_dataset()
+    print(f"{'column':<12} {'values':>7} {'build ms':>9} {'distinct':>9} {'p50 us':>8} {'p95 us':>8} "
+          f"{'p99 us':>8} {'max us':>8} {'names/s':>9} {'top-1':>6} {f'top-{args.k}':>6}")
+    for column in MATCH_COLUMNS:
+        start = time.perf_counter()
+        matcher = dataset.name_matcher(column)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        pairs = noisy_names(matcher.values, args.names)
+        source = dict(pairs)
+        latencies = []
+        top1 = topk = 0
+        for name in source:
+            start = time.perf_counter()
+            matches = matcher.match(name, args.k)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            values = [value for value, _ in matches]
+            top1 += bool(values) and values[0] == source[name]
+            topk += source[name] in values
+
+        names = [name for name, _ in pairs]
+        start = time.perf_counter()
+        matcher.classify(names, args.k)
+        rate = len(names) / (time.perf_counter() - start)
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{column:<12} {len(matcher):>7} {build_ms:>9.1f} {len(source):>9} {p50:>8.0f} {p95:>8.0f} "
+              f"{p99:>8.0f} {max(latencies):>8.0f} {rate:>9.0f} {top1 / len(source):>6.1%} {topk / len(source):>6.1%}")
+
+
+if __name__ == '__main__':
+    main()
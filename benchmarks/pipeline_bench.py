@@ -0,0 +1,222 @@
+"""Latency and memory of each request stage at scaled dataset sizes.
+
+For every table size a synthetic dataset shaped like the real one is
+built (see synthetic_data.py), and each filter scenario runs through the
+stages of a request the way build_interface runs them: row selection,
+stats, facet counts, the first table page and every chart type, then the
+whole uncached request. Each stage reports its p50 and p95 latency over
+the repeats and the peak memory it allocates (measured with tracemalloc
+in one extra, untimed run).
+
+Results are written as JSON; pass an earlier run with --compare to flag
+the stages whose p50 got slower by more than --threshold:
+
+    python benchmarks/pipeline_bench.py --sizes 10000 100000 --output before.json
+    python benchmarks/pipeline_bench.py --sizes 10000 100000 --compare before.json
+
+Run from the repository root.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gradio_app
+from aggregation import CountCube
+from charts import chart_spec, render_chart
+from core import select_rows
+from dataset import Dataset
+from level_parser import add_level_columns
+from synthetic_data import source_table, synthetic_frame
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+CHART_TYPES = ["contaminant_distribution", "commodity_distribution", "level_type_distribution",
+               "heatmap", "level_type_by_contaminant"]
+REPEATS = 10
+RESULTS_DIR = 'benchmarks/results'
+
+
+def scenarios(base):
+    """Filter inputs per scenario, as the dropdowns, search box and level range pass them"""
+    def top(column, n):
+        return base[column].value_counts().index[:n].tolist()
+
+    none = {'contaminant': None, 'commodity': None, 'level_type': None, 'search_term': "",
+            'level_min': None, 'level_max': None, 'level_unit': "ppm", 'search_mode': "exact"}
+    return {
+        'unfiltered': none,
+        'multi_select': dict(none, contaminant=top('Contaminant', 3), level_type=top('Contaminant Level Type', 2)),
+        'commodity_select': dict(none, commodity=top('Commodity', 5)),
+        'search': dict(none, search_term="fish"),
+        'ranked_search': dict(none, search_term="fihs lead", search_mode="ranked"),
+        'level_range': dict(none, level_min=0.05, level_max=0.5),
+        'combined': dict(none, contaminant=top('Contaminant', 3), search_term="fish", level_min=0.05, level_max=0.5),
+    }
+
+
+def build_dataset(base, n_rows):
+    """Dataset of n_rows synthetic rows, built the way a CSV load builds it"""
+    df = add_level_columns(synthetic_frame(base, n_rows))
+    return Dataset.from_frame(df, datetime.now().strftime('%Y-%m-%d'), f"synthetic-{n_rows}")
+
+
+def measure(fn, repeats, setup=None):
+    """(p50 ms, p95 ms, peak MiB) of fn over ``repeats`` timed runs and one traced run"""
+    samples = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 95)), peak / 2**20
+
+
+def stages(dataset, inputs, chart_backend):
+    """(stage name, function, setup) for every stage of one scenario"""
+    args = [inputs[name] for name in
+            ['contaminant', 'commodity', 'level_type', 'search_term', 'level_min', 'level_max', 'level_unit']]
+    mode = inputs['search_mode']
+    row_ids = select_rows(*args, dataset=dataset, search_mode=mode)
+
+    def chart(chart_type):
+        return lambda: render_chart(chart_spec(CountCube(dataset.engine, row_ids), chart_type), chart_backend)
+
+    def cold_caches():
+        gradio_app.selection_cache.clear()
+        gradio_app.figure_cache.clear()
+
+    return len(row_ids), [
+        ('select', lambda: select_rows(*args, dataset=dataset, search_mode=mode), None),
+        ('stats', lambda: gradio_app.calculate_stats(dataset, row_ids), None),
+        ('facets', lambda: gradio_app.facet_updates(dataset, *args, mode), None),
+        ('table', lambda: gradio_app.table_page(dataset, row_ids, 1, gradio_app.PAGE_SIZES[0], "", "ascending"), None),
+        *[(f"chart:{chart_type}", chart(chart_type), None) for chart_type in CHART_TYPES],
+        ('request', lambda: gradio_app.build_interface(dataset, *args, CHART_TYPES[0], chart_backend=chart_backend,
+                                                       search_mode=mode),
+         cold_caches),
+    ]
+
+
+def run(sizes, repeats, chart_backend):
+    base = source_table()
+    results = []
+    print(f"{'rows':>10} {'scenario':<17} {'stage':<35} {'p50 ms':>9} {'p95 ms':>9} {'peak MiB':>9} {'matches':>9}")
+    for n_rows in sizes:
+        start = time.perf_counter()
+        tracemalloc.start()
+        try:
+            dataset = build_dataset(base, n_rows)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        build_ms = (time.perf_counter() - start) * 1000
+        results.append({'rows': n_rows, 'scenario': 'build', 'stage': 'build', 'p50_ms': build_ms,
+                        'p95_ms': build_ms, 'peak_mib': peak / 2**20, 'matches': n_rows})
+        print(f"{n_rows:>10} {'build':<17} {'build':<35} {build_ms:>9.1f} {build_ms:>9.1f} {peak / 2**20:>9.1f}")
+
+        for scenario, inputs in scenarios(base).items():
+            matches, scenario_stages = stages(dataset, inputs, chart_backend)
+            for stage, fn, setup in scenario_stages:
+                p50, p95, peak_mib = measure(fn, repeats, setup)
+                results.append({'rows': n_rows, 'scenario': scenario, 'stage': stage, 'p50_ms': p50,
+                                'p95_ms': p95, 'peak_mib': peak_mib, 'matches': matches})
+                print(f"{n_rows:>10} {scenario:<17} {stage:<35} {p50:>9.2f} {p95:>9.2f} {peak_mib:>9.1f} {matches:>9}")
+        del dataset
+    return results
+
+
+def environment(repeats, chart_backend):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeats': repeats,
+        'chart_backend': chart_backend,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the stages whose p50 changed against the baseline; return the number of regressions"""
+    before = {(r['rows'], r['scenario'], r['stage']): r for r in baseline['results']}
+    regressions = 0
+    print(f"\nAgainst {baseline['environment'].get('commit')} ({baseline['environment']['date']}):")
+    print(f"{'rows':>10} {'scenario':<17} {'stage':<35} {'before ms':>10} {'after ms':>10} {'ratio':>7}")
+    for result in results:
+        old = before.get((result['rows'], result['scenario'], result['stage']))
+        if old is None:
+            continue
+        ratio = result['p50_ms'] / max(old['p50_ms'], 1e-6)
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = '  slower'
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        if flag:
+            print(f"{result['rows']:>10} {result['scenario']:<17} {result['stage']:<35} "
+                  f"{old['p50_ms']:>10.2f} {result['p50_ms']:>10.2f} {ratio:>7.2f}{flag}")
+    print(f"{regressions} stages more than {threshold:g}x slower")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the request stages at scaled dataset sizes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="table sizes (default: %(default)s)")
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="timed runs per stage (default: %(default)s)")
+    parser.add_argument('--chart-backend', default=gradio_app.CHART_BACKEND, choices=['plotly', 'matplotlib'],
+                        help="backend the chart stages render with (default: %(default)s)")
+    parser.add_argument('--output', help=f"results file (default: {RESULTS_DIR}/pipeline-<date>.json)")
+    parser.add_argument('--compare', help="results file of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="p50 ratio counted as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeats, args.chart_backend)
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'environment': environment(args.repeats, args.chart_backend),
+            'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+"""Chart render throughput on request threads versus a RenderPool.
+
+Renders every matplotlib chart type for the full dataset from CONCURRENCY
+threads, first on the threads themselves (where they serialize on the
+GIL), then through render pools of increasing size. Throughput with the
+pool should grow with the worker count up to the number of cores.
+
+Run from the repository root:
+
+    python benchmarks/render_pool_bench.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation import CountCube
+from charts import chart_spec, render_chart
+from dataset import Dataset
+from render_pool import RenderPool
+
+CHART_TYPES = ["contaminant_distribution", "commodity_distribution", "level_type_distribution",
+               "heatmap", "level_type_by_contaminant"]
+CONCURRENCY = 8
+RENDERS = 40
+
+
+def throughput(render, specs):
+    """Renders per second with CONCURRENCY threads sharing the specs"""
+    def work(offset):
+        for spec in specs[offset::CONCURRENCY]:
+            render(spec)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(CONCURRENCY)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(specs) / (time.perf_counter() - start)
+
+
+def main():
+    dataset = Dataset.load()
+    cube = CountCube(dataset.engine, dataset.engine.all_rows())
+    specs = [chart_spec(cube, CHART_TYPES[i % len(CHART_TYPES)]) for i in range(RENDERS)]
+
+    print(f"{os.cpu_count()} cores, {CONCURRENCY} concurrent requests, {RENDERS} renders")
+    print(f"{'renderer':>16} {'renders/s':>10}")
+    print(f"{'request threads':>16} {throughput(lambda spec: render_chart(spec, 'matplotlib'), specs):>10.1f}")
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        pool = RenderPool(workers, max_pending=RENDERS, timeout=60).start()
+        pool.render(specs[0])
+        print(f"{f'pool of {workers}':>16} {throughput(pool.render, specs):>10.1f}")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
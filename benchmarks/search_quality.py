@@ -0,0 +1,44 @@
+"""Check that ranked search puts the expected row first for known queries.
+
+Each query is a misspelled or loosely worded search a user could type,
+paired with the Contaminant and Commodity of the row it should return
+first. Exits non-zero when any query ranks another row first.
+
+Run from the repository root:
+
+    python benchmarks/search_quality.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core
+
+# query -> (Contaminant, Commodity) of the row expected first
+EXPECTED = {
+    'aflatoxn peanuts': ('Aflatoxins, total', 'Peanuts and peanut products'),
+    'cadmuim ceramic flatware': ('Cadmium', 'Ceramicware - flatware'),
+    'nitrosodimethyl amine malt beverages': ('Dimethylnitrosamine (nitrosodimethylamine)', 'Malt beverages'),
+    'pcbs poultry': ("Polychlorinated Biphenyls (PCB's)", 'Poultry'),
+}
+
+
+def main():
+    dataset = core.current_dataset()
+    columns = dataset.engine.columns
+    failures = 0
+    for query, expected in EXPECTED.items():
+        rows, _ = dataset.ranked_search().search(query, k=5)
+        found = [
+            tuple(columns[column].categories[columns[column].codes[row]] for column in ['Contaminant', 'Commodity'])
+            for row in rows
+        ]
+        ok = bool(found) and found[0] == expected
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<5} {query!r}: {' / '.join(found[0]) if found else 'no rows'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
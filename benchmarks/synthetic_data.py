@@ -0,0 +1,97 @@
+"""Synthetic contaminant tables of any size, shaped like the real one.
+
+Rows are drawn from the real CSV with replacement, so the frequencies of
+contaminants, level types and references, and which of them go together,
+stay those of the FDA table. To let the dictionaries grow with the table
+the way they would with more data, commodities get a variant suffix
+("Barley malt #12") with a long-tailed distribution, and Level values are
+rescaled but keep the exact format of the string they came from: the
+comparator, unit spelling and qualifier of "<1 Bq/kg" or
+"0.3 ppm (fat basis)" survive, only the number changes.
+
+Write a table as CSV, e.g. to benchmark loading it:
+
+    python benchmarks/synthetic_data.py 1000000 /tmp/contaminants-1m.csv
+"""
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import DATA_PATH, read_csv_data
+from level_parser import LEVEL_COLUMNS
+
+# The number in a Level string, with the comparator before it and the unit and qualifier after it
+LEVEL_NUMBER = re.compile(r'(\d+(?:\.\d*)?|\.\d+)')
+
+# Factors Level values are rescaled by, most often left unchanged
+LEVEL_FACTORS = np.array([1, 1, 1, 1, 0.5, 2, 0.1, 5, 10])
+
+# Zipf exponent of the commodity variants; lower grows more distinct commodities per row
+VARIANT_EXPONENT = 1.6
+
+
+def source_table(path=DATA_PATH):
+    """The real table's source columns, cleaned the way the app reads them"""
+    df = read_csv_data(path)
+    return df[[column for column in df.columns if column not in LEVEL_COLUMNS]]
+
+
+def rescale_level(level, factor):
+    """``level`` with its number multiplied by ``factor``, in the same format"""
+    if not isinstance(level, str):
+        return level
+    return LEVEL_NUMBER.sub(lambda match: f"{float(match.group()) * factor:g}", level, count=1)
+
+
+def map_pairs(codes, variants, make):
+    """make(code, variant) for every row, called once per distinct pair"""
+    pairs, inverse = np.unique(np.stack([codes, variants]), axis=1, return_inverse=True)
+    values = np.array([make(code, variant) for code, variant in pairs.T], dtype=object)
+    return values[inverse.ravel()]
+
+
+def synthetic_frame(base, n_rows, seed=0):
+    """``n_rows`` rows sampled from ``base``, with commodity variants and rescaled levels"""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(base), n_rows)
+    df = pd.DataFrame({column: base[column].to_numpy(dtype=object)[rows] for column in base.columns})
+
+    # Variant 1 keeps the real name; later variants get rarer
+    commodity_codes, commodities = pd.factorize(base['Commodity'])
+    variants = np.minimum(rng.zipf(VARIANT_EXPONENT, n_rows), max(1, n_rows // len(base)))
+    df['Commodity'] = map_pairs(
+        commodity_codes[rows], variants,
+        lambda code, variant: np.nan if code < 0 else commodities[code] if variant == 1 else f"{commodities[code]} #{variant}",
+    )
+
+    level_codes, levels = pd.factorize(base['Level'])
+    factors = rng.integers(0, len(LEVEL_FACTORS), n_rows)
+    df['Level'] = map_pairs(
+        level_codes[rows], factors,
+        lambda code, factor: np.nan if code < 0 else rescale_level(levels[code], LEVEL_FACTORS[factor]),
+    )
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic contaminant table shaped like the real one")
+    parser.add_argument('rows', type=int, help="number of rows")
+    parser.add_argument('output', help="CSV file to write")
+    parser.add_argument('--csv', default=DATA_PATH, help="real table to sample (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: %(default)s)")
+    args = parser.parse_args()
+
+    df = synthetic_frame(source_table(args.csv), args.rows, args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"Wrote {len(df)} rows to {args.output} ({df['Commodity'].nunique()} commodities, "
+          f"{df['Level'].nunique()} levels)")
+
+
+if __name__ == '__main__':
+    main()
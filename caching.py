@@ -0,0 +1,159 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Content hash of a file, used as the dataset version"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+# Bytes before the old end of a file that must be unchanged for a change to count as an append
+CURSOR_TAIL_BYTES = 4096
+
+
+class FileCursor:
+    """Content hash of a file up to the position it has been read to.
+
+    ``version`` equals file_digest of the bytes read so far. ``appended``
+    returns the bytes written after them, so following a file that only
+    grows costs reading and hashing the new bytes. A file that shrank, whose
+    bytes just before the old end changed, or whose last line was not
+    terminated yet (it may have been extended) was not simply appended to.
+    """
+
+    def __init__(self, digest, size, tail):
+        self.digest = digest
+        self.size = size
+        self.tail = tail
+
+    @classmethod
+    def open(cls, path, chunk_size=1 << 20):
+        """Cursor at the end of the file's current contents"""
+        digest = hashlib.sha256()
+        size = 0
+        tail = b''
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                tail = (tail + chunk)[-CURSOR_TAIL_BYTES:]
+        return cls(digest, size, tail)
+
+    @property
+    def version(self):
+        return self.digest.hexdigest()[:16]
+
+    def appended(self, path):
+        """(bytes appended since this cursor, cursor after them), or None if the file changed otherwise"""
+        if not self.tail.endswith(b'\n'):
+            return None
+        with open(path, 'rb') as f:
+            f.seek(self.size - len(self.tail))
+            if f.read(len(self.tail)) != self.tail:
+                return None
+            data = f.read()
+        digest = self.digest.copy()
+        digest.update(data)
+        return data, FileCursor(digest, self.size + len(data), (self.tail + data)[-CURSOR_TAIL_BYTES:])
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by a memory budget.
+
+    Each entry is stored with its size in bytes, supplied by the caller, and
+    the oldest entries are evicted once the total exceeds ``max_bytes``.
+    Entries larger than the whole budget are not cached. Keys are expected
+    to carry the dataset version as their last element so stale entries can
+    be dropped with ``evict_stale``.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        """Whether the key is cached; unlike get, counts no hit or miss and keeps the LRU order"""
+        return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def carry_over(self, old_version, version, update):
+        """Move entries of ``old_version`` that are still valid to ``version``; drop other stale ones.
+
+        ``update(key, value, size)`` returns the (value, size) to keep under
+        the new version, or None to drop the entry.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[-1] != version]:
+                value, size = self.entries.pop(key)
+                self.current_bytes -= size
+                kept = update(key, value, size) if key[-1] == old_version else None
+                if kept is None:
+                    self.evictions += 1
+                    continue
+                self.entries[key[:-1] + (version,)] = kept
+                self.current_bytes += kept[1]
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def evict_stale(self, version):
+        """Drop every entry whose key was built for another dataset version"""
+        with self.lock:
+            for key in [key for key in self.entries if key[-1] != version]:
+                self.current_bytes -= self.entries.pop(key)[1]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and memory use, for logging and metrics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
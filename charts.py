@@ -0,0 +1,240 @@
+"""Chart specs and the backends that draw them.
+
+A chart spec is a small dict holding only what a chart shows: the
+aggregated series sliced from the count cube, titles and axis labels.
+Building one costs the aggregation alone. The plotly backend sends the
+spec to the browser as a plotly figure description (a few hundred bytes)
+and lets plotly.js draw it; the matplotlib backend (matplotlib_charts.py,
+imported on first use) renders it to a PNG on the server and is kept as a
+fallback.
+"""
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Chart backends, in order of preference
+CHART_BACKENDS = ['plotly', 'matplotlib']
+
+# Heatmap cells are annotated with their counts up to this many rows/columns
+ANNOTATE_LIMIT = 20
+
+
+# Chart specs, built from a count cube
+def message_spec(message="No data available for visualization"):
+    return {'kind': 'message', 'message': message}
+
+
+def bar_spec(cube, column, title, color):
+    """Top 15 values of one column by row count"""
+    labels, counts = cube.value_counts(column, 15)
+    return {
+        'kind': 'bar',
+        'title': title,
+        'x_label': column,
+        'y_label': 'Count',
+        'labels': labels,
+        'values': counts.tolist(),
+        'color': color,
+    }
+
+
+def pie_spec(cube):
+    labels, counts = cube.value_counts('Contaminant Level Type')
+    return {
+        'kind': 'pie',
+        'title': 'Distribution of Contaminant Level Types',
+        'labels': labels,
+        'values': counts.tolist(),
+    }
+
+
+def heatmap_spec(cube, top_n=10):
+    contaminant_codes = cube.top('Contaminant', top_n)
+    commodity_codes = cube.top('Commodity', top_n)
+
+    # Slice the matrix for the heatmap out of the count cube
+    matrix = cube.crosstab('Contaminant', 'Commodity', contaminant_codes, commodity_codes)
+    return {
+        'kind': 'heatmap',
+        'title': 'Heatmap of Top Contaminants vs Top Commodities',
+        'x_labels': [cube.label('Commodity', code) for code in commodity_codes],
+        'y_labels': [cube.label('Contaminant', code) for code in contaminant_codes],
+        'matrix': matrix.tolist(),
+        'annotate': top_n <= ANNOTATE_LIMIT,
+    }
+
+
+def stacked_bar_spec(cube):
+    contaminant_codes = cube.top('Contaminant', 10)
+    level_type_codes = np.flatnonzero(cube.marginal('Contaminant Level Type'))
+
+    # One row of counts per level type, sliced from the count cube
+    matrix = cube.crosstab('Contaminant Level Type', 'Contaminant', level_type_codes, contaminant_codes)
+    return {
+        'kind': 'stacked_bar',
+        'title': 'Contaminant Level Types by Top 10 Contaminants',
+        'x_label': 'Contaminant',
+        'y_label': 'Count',
+        'legend_title': 'Level Type',
+        'labels': [cube.label('Contaminant', code) for code in contaminant_codes],
+        'series': [
+            {'name': cube.label('Contaminant Level Type', code), 'values': row.tolist()}
+            for code, row in zip(level_type_codes, matrix)
+        ],
+    }
+
+
+def chart_spec(cube, chart_type):
+    """Spec of the chart of a given type for the rows in a count cube"""
+    try:
+        # Handle empty data
+        if cube.empty:
+            return message_spec()
+
+        if chart_type == "commodity_distribution":
+            return bar_spec(cube, 'Commodity', 'Top 15 Commodities by Frequency', '#2ca02c')
+        elif chart_type == "level_type_distribution":
+            return pie_spec(cube)
+        elif chart_type == "heatmap":
+            return heatmap_spec(cube)
+        elif chart_type == "level_type_by_contaminant":
+            return stacked_bar_spec(cube)
+        else:
+            # Contaminant distribution, also the default for unknown chart types
+            return bar_spec(cube, 'Contaminant', 'Top 15 Contaminants by Frequency', '#1f77b4')
+
+    except Exception as e:
+        logger.exception("Could not build the %s chart", chart_type)
+        return message_spec(f"Error creating visualization: {str(e)}")
+
+
+# Plotly backend: translate specs into plotly figure JSON drawn by the browser
+def plotly_layout(spec, **layout):
+    layout.setdefault('title', {'text': spec.get('title', '')})
+    layout.setdefault('margin', {'b': 120})
+    return layout
+
+
+def plotly_message(spec):
+    return {'data': [], 'layout': {
+        'xaxis': {'visible': False},
+        'yaxis': {'visible': False},
+        'annotations': [{'text': spec['message'], 'showarrow': False, 'font': {'size': 16},
+                         'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5}],
+    }}
+
+
+def plotly_bar(spec):
+    return {
+        'data': [{
+            'type': 'bar',
+            'x': spec['labels'],
+            'y': spec['values'],
+            'marker': {'color': spec['color']},
+            'text': spec['values'],
+            'textposition': 'outside',
+        }],
+        'layout': plotly_layout(
+            spec,
+            xaxis={'title': {'text': spec['x_label']}, 'tickangle': -45},
+            yaxis={'title': {'text': spec['y_label']}},
+        ),
+    }
+
+
+def plotly_pie(spec):
+    return {
+        'data': [{
+            'type': 'pie',
+            'labels': spec['labels'],
+            'values': spec['values'],
+            'textinfo': 'percent',
+            'sort': False,
+            'direction': 'counterclockwise',
+            'rotation': 90,
+        }],
+        'layout': plotly_layout(spec),
+    }
+
+
+def plotly_heatmap(spec):
+    trace = {
+        'type': 'heatmap',
+        'x': spec['x_labels'],
+        'y': spec['y_labels'],
+        'z': spec['matrix'],
+        'colorscale': 'Viridis',
+        'colorbar': {'title': {'text': 'Count'}},
+    }
+    if spec['annotate']:
+        trace['texttemplate'] = '%{z}'
+    return {
+        'data': [trace],
+        'layout': plotly_layout(
+            spec,
+            height=700,
+            xaxis={'tickangle': -45},
+            yaxis={'autorange': 'reversed'},
+        ),
+    }
+
+
+def plotly_stacked_bar(spec):
+    return {
+        'data': [
+            {'type': 'bar', 'name': series['name'], 'x': spec['labels'], 'y': series['values']}
+            for series in spec['series']
+        ],
+        'layout': plotly_layout(
+            spec,
+            barmode='stack',
+            height=700,
+            xaxis={'title': {'text': spec['x_label']}, 'tickangle': -45},
+            yaxis={'title': {'text': spec['y_label']}},
+            legend={'title': {'text': spec['legend_title']}},
+        ),
+    }
+
+
+PLOTLY_BUILDERS = {
+    'message': plotly_message,
+    'bar': plotly_bar,
+    'pie': plotly_pie,
+    'heatmap': plotly_heatmap,
+    'stacked_bar': plotly_stacked_bar,
+}
+
+
+def plotly_json(spec):
+    return json.dumps(PLOTLY_BUILDERS[spec['kind']](spec), ensure_ascii=False, separators=(',', ':'))
+
+
+# What gr.Plot receives
+class PlotlyChart:
+    """Plotly figure JSON that gr.Plot passes to the browser as is"""
+
+    def __init__(self, figure_json):
+        self.figure_json = figure_json
+        self.nbytes = len(figure_json)
+
+    def to_json(self):
+        return self.figure_json
+
+
+def render_chart(spec, backend):
+    """Encode a spec for a backend: PNG bytes for matplotlib, figure JSON for plotly"""
+    if backend == 'matplotlib':
+        from matplotlib_charts import matplotlib_figure, render_png
+        return render_png(matplotlib_figure(spec))
+    return plotly_json(spec)
+
+
+def chart_output(rendered, backend):
+    """Wrap rendered output for gr.Plot"""
+    if backend == 'matplotlib':
+        from matplotlib_charts import PrerenderedFigure
+        return PrerenderedFigure(rendered)
+    return PlotlyChart(rendered)
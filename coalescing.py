@@ -0,0 +1,76 @@
+import threading
+import time
+
+
+class Superseded(Exception):
+    """Raised inside a job once a newer request from the same session arrived"""
+
+
+class RequestCoalescer:
+    """Latest-wins gate for the jobs of each session.
+
+    Every job takes a ticket when it starts. A job only does real work if it
+    still holds the newest ticket of its session after a short settle delay,
+    and it can re-check at stage boundaries to abandon work whose result
+    nobody will see. A job without a session stands alone: it is never
+    superseded and does not wait. Dropped jobs are counted so worker time
+    spent on stale requests stays visible.
+    """
+
+    def __init__(self, delay=0.15, session_ttl=3600):
+        self.delay = delay
+        self.session_ttl = session_ttl
+        self.latest = {}
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    def begin(self, session):
+        """Register a new job for the session and return its ticket"""
+        now = time.monotonic()
+        with self.lock:
+            self.submitted += 1
+            if session is None:
+                return None, None
+            ticket = (self.latest.get(session, (0, now))[0] + 1, now)
+            self.latest[session] = ticket
+            if self.submitted % 1000 == 0:
+                self._forget_idle_sessions(now)
+        return session, ticket
+
+    def is_current(self, job):
+        session, ticket = job
+        return session is None or self.latest.get(session) == ticket
+
+    def check(self, job):
+        """Raise Superseded when a newer job of the same session exists"""
+        if not self.is_current(job):
+            raise Superseded()
+
+    def settle(self, job):
+        """Wait for the settle delay, then report whether the job is still the latest"""
+        if self.delay > 0 and job[0] is not None and self.is_current(job):
+            time.sleep(self.delay)
+        return self.is_current(job)
+
+    def finish(self, job, dropped=False):
+        with self.lock:
+            if dropped:
+                self.coalesced += 1
+            else:
+                self.completed += 1
+
+    def _forget_idle_sessions(self, now):
+        for session, (_, started) in list(self.latest.items()):
+            if now - started > self.session_ttl:
+                del self.latest[session]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'coalesced': self.coalesced,
+                'sessions': len(self.latest),
+            }
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from filter_engine import ColumnIndex
+
+
+class ColumnStore:
+    """Read-only columnar table that materializes rows only on request.
+
+    Text columns are held as their ColumnIndex (int32 codes plus the list
+    of distinct values) and other columns as plain arrays. When the arrays
+    are memory-mapped from a snapshot, every process serving the same
+    snapshot shares them through the page cache, and a process only holds
+    the distinct values and the rows it is currently turning into a
+    DataFrame.
+    """
+
+    def __init__(self, columns, indexes, values):
+        self.columns = list(columns)
+        self.indexes = indexes
+        self.values = values
+        self.n_rows = len(next(iter(indexes.values())).codes) if indexes else len(next(iter(values.values())))
+
+    @classmethod
+    def from_frame(cls, df, indexes=None):
+        """Encode a DataFrame; text columns reuse ``indexes`` where given"""
+        indexes = dict(indexes or {})
+        values = {}
+        for column in df.columns:
+            if df[column].dtype != 'object':
+                values[column] = df[column].to_numpy()
+            elif column not in indexes:
+                indexes[column] = ColumnIndex.from_values(df[column])
+        return cls(df.columns, {column: indexes[column] for column in df.columns if column not in values}, values)
+
+    def append(self, df):
+        """New store with the rows of ``df`` added after the last row.
+
+        Text columns are extended through copies of their indexes, so this
+        store keeps serving exactly its own rows; encoding costs follow the
+        number of new rows and new distinct values.
+        """
+        indexes = {}
+        for column, index in self.indexes.items():
+            indexes[column] = index.copy()
+            indexes[column].append(df[column].tolist())
+        values = {
+            column: np.concatenate((array, df[column].to_numpy(dtype=array.dtype)))
+            for column, array in self.values.items()
+        }
+        return ColumnStore(self.columns, indexes, values)
+
+    def __len__(self):
+        return self.n_rows
+
+    def dtype(self, column):
+        if column in self.values:
+            return self.values[column].dtype
+        return np.dtype(object)
+
+    def column(self, column, row_ids=None):
+        """Values of one column, for all rows or the given row ids"""
+        if column in self.values:
+            values = self.values[column]
+            return np.asarray(values if row_ids is None else values[row_ids])
+        index = self.indexes[column]
+        return index.labels()[index.codes if row_ids is None else index.codes[row_ids]]
+
+    def take(self, row_ids, columns=None):
+        """DataFrame of the given rows (indexed by row id) and columns"""
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({column: self.column(column, row_ids) for column in columns},
+                            index=np.asarray(row_ids), columns=columns)
+
+    def to_frame(self):
+        """The whole table as a DataFrame; costs a full copy"""
+        return pd.DataFrame({column: self.column(column) for column in self.columns}, columns=self.columns)
@@ -0,0 +1,272 @@
+"""Check lab sample results against the FDA limits, in bulk.
+
+A sample is a contaminant, a commodity and a measured value with its unit
+("20", "ppb"; or "20 ppb" in one column). ``LimitIndex`` holds every limit
+of the dataset keyed by its normalized (contaminant, commodity) pair: names
+are compared after the same whitespace normalization the CSV gets and
+case-insensitively. ``check_samples`` joins a table of samples to the
+limits and evaluates them in a few array operations. Names and units are
+normalized once per distinct value, each pair is looked up by binary search
+over the sorted pair codes, and the measured values are converted to the
+limit's canonical unit (ppb and µg/kg to ppm, mg/l to µg/mL, ...). The work
+is the same whether a file holds a hundred samples or millions.
+
+Every sample gives one result row per limit it falls under, with a Status
+of:
+
+- ``exceeds``: the value is above the limit (at or above it for a "<" limit)
+- ``within``: the value is within the limit
+- ``no_limit``: no limit for this contaminant and commodity
+- ``unit_mismatch``: the value's unit cannot be compared with the limit's
+- ``invalid``: the value is not a number or its unit is unknown
+
+Large files are read, checked and written in chunks, optionally in several
+processes (which also share the cost of writing the CSV):
+
+    python compliance.py samples.csv --output results.csv --workers 4
+    python compliance.py samples.csv --only exceeds unit_mismatch
+
+The command exits with status 1 when any sample exceeds a limit.
+"""
+import argparse
+import collections
+import itertools
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from csv_source import normalize_text
+from dataset import DATA_PATH, Dataset
+from level_parser import UNITS, normalize_level_text, parse_level
+from snapshot import SNAPSHOT_DIR
+
+# Samples checked per chunk of a file
+CHUNK_ROWS = 200_000
+
+# Sample columns, matched case-insensitively; unit may be left out when value carries it ("20 ppb")
+SAMPLE_COLUMNS = ['contaminant', 'commodity', 'value', 'unit']
+
+# Limit columns added to every result row
+RESULT_COLUMNS = ['Limit Type', 'Limit', 'Reference', 'Status', 'Ratio']
+
+STATUSES = ['exceeds', 'within', 'no_limit', 'unit_mismatch', 'invalid']
+
+
+def name_key(value):
+    """What names are matched on: normalized whitespace, case-folded"""
+    return normalize_text(value).casefold() if isinstance(value, str) else None
+
+
+def encode(values, lookup):
+    """Code of every value in ``lookup`` (keyed by name_key), -1 when missing; keys are built per distinct value"""
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([lookup.get(name_key(value), -1) for value in uniques] + [-1], dtype=np.int64)
+    return mapped[codes]
+
+
+def parse_units(units):
+    """(unit family, factor to the family's canonical unit) of every unit string; family None if unknown"""
+    codes, uniques = pd.factorize(units)
+    parsed = [UNITS.get(normalize_level_text(unit).lower(), (None, np.nan)) if isinstance(unit, str) else (None, np.nan)
+              for unit in uniques] + [(None, np.nan)]
+    families = np.array([family for family, _ in parsed], dtype=object)
+    factors = np.array([factor for _, factor in parsed], dtype=float)
+    return families[codes], factors[codes]
+
+
+def parse_measurements(values):
+    """(canonical value, unit family) of every "20 ppb" style measurement, parsed per distinct string"""
+    codes, uniques = pd.factorize(values)
+    parsed = [parse_level(value) for value in uniques] + [(np.nan, None, None, None)]
+    levels = np.array([value for value, *_ in parsed], dtype=float)
+    families = np.array([family for _, family, *_ in parsed], dtype=object)
+    return levels[codes], families[codes]
+
+
+class LimitIndex:
+    """The limits of a dataset, keyed by normalized (contaminant, commodity).
+
+    Pairs are encoded as one integer (contaminant code times the number of
+    commodities plus commodity code) and sorted, so a batch of samples is
+    matched with two binary searches instead of a Python loop.
+    """
+
+    def __init__(self, limits):
+        self.contaminants = {}
+        self.commodities = {}
+        contaminants = np.array([self.contaminants.setdefault(name_key(value), len(self.contaminants))
+                                 for value in limits['Contaminant']], dtype=np.int64)
+        commodities = np.array([self.commodities.setdefault(name_key(value), len(self.commodities))
+                                for value in limits['Commodity']], dtype=np.int64)
+        pairs = contaminants * len(self.commodities) + commodities
+
+        self.order = np.argsort(pairs, kind='stable')
+        self.pairs = pairs[self.order]
+        self.values = limits['Level Value'].to_numpy(dtype=float)
+        self.families = limits['Level Unit'].to_numpy(dtype=object)
+        # A "<" limit is exceeded by a value equal to it
+        self.strict = (limits['Level Comparator'] == '<').to_numpy()
+        self.types = limits['Contaminant Level Type'].to_numpy(dtype=object)
+        self.levels = limits['Level'].to_numpy(dtype=object)
+        self.references = limits['Reference'].to_numpy(dtype=object)
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        return cls(dataset.take(dataset.engine.all_rows()))
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def match(self, contaminants, commodities):
+        """(sample positions, limit rows) of every sample/limit match, -1 as the limit of unmatched samples"""
+        contaminant_codes = encode(contaminants, self.contaminants)
+        commodity_codes = encode(commodities, self.commodities)
+        pairs = contaminant_codes * len(self.commodities) + commodity_codes
+        known = (contaminant_codes >= 0) & (commodity_codes >= 0)
+        starts = np.searchsorted(self.pairs, pairs, side='left')
+        counts = np.where(known, np.searchsorted(self.pairs, pairs, side='right') - starts, 0)
+
+        # Unmatched samples keep one row, pointing at no limit
+        rows = np.maximum(counts, 1)
+        samples = np.repeat(np.arange(len(pairs)), rows)
+        first = np.repeat(np.cumsum(rows) - rows, rows)
+        positions = np.repeat(starts, rows) + np.arange(len(samples)) - first
+        matched = np.repeat(counts > 0, rows)
+        limits = np.full(len(samples), -1, dtype=np.int64)
+        limits[matched] = self.order[positions[matched]]
+        return samples, limits
+
+
+def sample_columns(samples):
+    """Map SAMPLE_COLUMNS to the sample table's own column names"""
+    by_name = {str(column).strip().lower(): column for column in samples.columns}
+    missing = [name for name in SAMPLE_COLUMNS[:3] if name not in by_name]
+    if missing:
+        raise ValueError(f"Sample table needs the columns {SAMPLE_COLUMNS[:3]} (and optionally 'unit'); "
+                         f"missing {missing}")
+    return {name: by_name.get(name) for name in SAMPLE_COLUMNS}
+
+
+def check_samples(samples, limits):
+    """The sample table with RESULT_COLUMNS added, one row per sample and applicable limit"""
+    columns = sample_columns(samples)
+    sample_ids, limit_ids = limits.match(samples[columns['contaminant']], samples[columns['commodity']])
+
+    if columns['unit'] is not None:
+        families, factors = parse_units(samples[columns['unit']])
+        values = pd.to_numeric(samples[columns['value']], errors='coerce').to_numpy(dtype=float) * factors
+    else:
+        values, families = parse_measurements(samples[columns['value']].astype(object))
+    values, families = values[sample_ids], families[sample_ids]
+
+    matched = limit_ids >= 0
+    limit_at = np.where(matched, limit_ids, 0)
+    limit_values = np.where(matched, limits.values[limit_at], np.nan)
+    comparable = matched & (families == limits.families[limit_at])
+    exceeds = np.where(limits.strict[limit_at], values >= limit_values, values > limit_values)
+
+    valid = ~np.isnan(values) & pd.notna(families)
+    status = np.select(
+        [~valid, ~matched, ~comparable, exceeds],
+        ['invalid', 'no_limit', 'unit_mismatch', 'exceeds'],
+        default='within',
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(comparable & valid, values / limit_values, np.nan)
+
+    results = samples.iloc[sample_ids].reset_index(drop=True)
+    no_limit = np.array(None, dtype=object)
+    results['Limit Type'] = np.where(matched, limits.types[limit_at], no_limit)
+    results['Limit'] = np.where(matched, limits.levels[limit_at], no_limit)
+    results['Reference'] = np.where(matched, limits.references[limit_at], no_limit)
+    results['Status'] = status
+    results['Ratio'] = ratio
+    return results
+
+
+def encode_results(samples, limits, header, statuses=None):
+    """Check a chunk of samples; return (results as CSV text, results per status).
+
+    Only results with one of ``statuses`` are written, if given; all are counted.
+    """
+    results = check_samples(samples, limits)
+    counts = {status: int(count) for status, count in results['Status'].value_counts().items()}
+    if statuses:
+        results = results[results['Status'].isin(statuses)]
+    return results.to_csv(index=False, header=header), counts
+
+
+# Each worker process gets the limit index once, when it starts
+worker_limits = None
+
+def init_worker(limits):
+    global worker_limits
+    worker_limits = limits
+
+
+def encode_in_worker(samples, header, statuses):
+    return encode_results(samples, worker_limits, header, statuses)
+
+
+def check_chunks(chunks, limits, workers=1, statuses=None):
+    """Iterator over (CSV text, results per status) of every chunk, in order.
+
+    With several workers, chunks are checked and encoded in parallel
+    processes; at most two chunks per worker are read ahead, so memory
+    stays bounded however large the input is.
+    """
+    headers = itertools.chain([True], itertools.repeat(False))
+    if workers <= 1:
+        for chunk, header in zip(chunks, headers):
+            yield encode_results(chunk, limits, header, statuses)
+        return
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(limits,)) as pool:
+        pending = collections.deque()
+        for chunk, header in zip(chunks, headers):
+            pending.append(pool.submit(encode_in_worker, chunk, header, statuses))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def check_file(path, output, limits, chunk_rows=CHUNK_ROWS, workers=1, statuses=None):
+    """Check a CSV of samples and write the results as CSV; return the number of results per status"""
+    totals = dict.fromkeys(STATUSES, 0)
+    chunks = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''], chunksize=chunk_rows)
+    for text, counts in check_chunks(chunks, limits, workers, statuses):
+        output.write(text)
+        for status, count in counts.items():
+            totals[status] += count
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check lab sample results against the FDA contaminant limits")
+    parser.add_argument('samples', help="CSV with contaminant, commodity, value and unit columns")
+    parser.add_argument('--output', '-o', default='-', help="results CSV (default: standard output)")
+    parser.add_argument('--csv', default=DATA_PATH, help="limits dataset (default: %(default)s)")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR, help="snapshot directory (default: %(default)s)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="samples per chunk (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes checking chunks in parallel (default: %(default)s)")
+    parser.add_argument('--only', nargs='+', choices=STATUSES, metavar='STATUS',
+                        help=f"write only results with these statuses ({', '.join(STATUSES)})")
+    args = parser.parse_args()
+
+    limits = LimitIndex.from_dataset(Dataset.load(args.csv, args.snapshot_dir))
+    if args.output == '-':
+        totals = check_file(args.samples, sys.stdout, limits, args.chunk_rows, args.workers, args.only)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            totals = check_file(args.samples, f, limits, args.chunk_rows, args.workers, args.only)
+
+    summary = ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in totals.items())
+    print(f"Checked {args.samples} against {len(limits)} limits: {summary}", file=sys.stderr)
+    return 1 if totals['exceeds'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,211 @@
+"""Headless core of the explorer: loading, filtering, stats and chart data.
+
+Everything the Gradio apps compute that does not need a UI lives here, so
+batch jobs and API workers can use it without importing gradio. Importing
+this module is cheap: the dataset is loaded on the first call that needs
+it, and matplotlib is only imported when a chart is rendered with it.
+
+    import core
+    df = core.filter_data(["Lead"], None, None, "", None, None)
+    core.filter_stats(df)['most_common_commodity']
+"""
+import os
+import re
+import threading
+
+import numpy as np
+
+from aggregation import CountCube, selection_stats
+from caching import LRUCache
+from charts import chart_spec
+from dataset import DATA_PATH, Dataset
+from reloading import DatasetReloader
+
+# Memory budget for the row ids of recent selections
+SELECTION_CACHE_BYTES = int(os.environ.get('SELECTION_CACHE_MB', '64')) * 1024 * 1024
+
+# How often the CSV is checked for changes to reload (0 disables reloading)
+RELOAD_INTERVAL_S = float(os.environ.get('RELOAD_INTERVAL_S', '5'))
+
+# Dropdowns pass raw values; an option label like "Value (123)" is accepted too
+OPTION_COUNT = re.compile(r' \(\d+\)$')
+
+# Selected row ids keyed by (canonical filters, dataset version), reused while paging
+selection_cache = LRUCache(SELECTION_CACHE_BYTES)
+
+# Caches of results derived from one selection, keyed like selection_cache
+result_caches = []
+
+# Caches of results that also depend on rows outside their selection, such as facet counts;
+# keyed with the dataset version last, and dropped on every reload
+dataset_caches = []
+
+_reloader = None
+_reloader_lock = threading.Lock()
+
+
+def carry_over_caches(old, new):
+    """Drop cache entries built for a dataset that is no longer served.
+
+    When the new dataset only adds rows to the old one, cached selections
+    are extended with the matching new rows instead, and results whose
+    selection gained no rows are kept as they are. Ranked searches are
+    dropped, as any new row can change their top rows and scores, and so
+    is everything in dataset_caches.
+    """
+    for cache in dataset_caches:
+        cache.evict_stale(new.version)
+    if new.base_version != old.version:
+        for cache in [selection_cache, *result_caches]:
+            cache.evict_stale(new.version)
+        return
+
+    new_rows = np.arange(new.base_rows, len(new.store), dtype=np.int32)
+    added = {}
+    def added_rows(filters):
+        if filters not in added:
+            added[filters] = select_canonical(new, filters, new_rows)
+        return added[filters]
+
+    def extend_selection(key, row_ids, size):
+        if is_ranked(key[0]):
+            return None
+        row_ids = np.concatenate((row_ids, added_rows(key[0])))
+        return row_ids, row_ids.nbytes
+
+    def keep_unchanged(key, value, size):
+        return None if is_ranked(key[0]) or len(added_rows(key[0])) else (value, size)
+
+    selection_cache.carry_over(old.version, new.version, extend_selection)
+    for cache in result_caches:
+        cache.carry_over(old.version, new.version, keep_unchanged)
+
+
+def get_reloader():
+    """The reloader serving the dataset; the first call loads it and starts watching the CSV.
+
+    The dataset comes from the binary snapshot when it matches the CSV.
+    Rows appended to the CSV are picked up incrementally, any other change
+    rebuilds the dataset in the background, and the new one is swapped in
+    atomically.
+    """
+    global _reloader
+    if _reloader is None:
+        with _reloader_lock:
+            if _reloader is None:
+                _reloader = DatasetReloader(DATA_PATH, Dataset.load, interval=RELOAD_INTERVAL_S,
+                                            on_swap=carry_over_caches, extend=Dataset.extend).start()
+    return _reloader
+
+
+def current_dataset():
+    """The dataset to serve a request from; read it once per request"""
+    return get_reloader().current
+
+
+def get_filter_options(column, dataset=None):
+    """Sorted ("Value (count)", value) filter options for a column"""
+    return (dataset or current_dataset()).filter_options(column)
+
+
+def extract_value(option):
+    if not option:
+        return None
+    # Only the trailing count is dropped; values such as "Polychlorinated Biphenyls (PCB's)" keep their parentheses
+    return OPTION_COUNT.sub('', option)
+
+
+def selected_values(option):
+    """Turn a dropdown selection (single option or list of options) into raw values"""
+    if isinstance(option, list):
+        return [extract_value(o) for o in option]
+    return [extract_value(option)]
+
+
+def canonical_filters(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit="ppm",
+                      search_mode="exact"):
+    """Normalize filter inputs into a hashable tuple that is equal for equivalent selections"""
+    def values(option):
+        return tuple(sorted(set(v for v in selected_values(option) if v is not None))) if option else ()
+
+    level_range = ()
+    if level_min is not None or level_max is not None:
+        level_range = (
+            None if level_min is None else float(level_min),
+            None if level_max is None else float(level_max),
+            level_unit,
+        )
+    # Search is case-insensitive, so the lower-cased term selects the same rows
+    search = ((search_term or "").lower(), search_mode) if search_term else ()
+    return (values(contaminant), values(commodity), values(level_type), search, level_range)
+
+
+def is_ranked(filters):
+    """Whether a canonical_filters tuple searches in ranked mode"""
+    return filters[3][1:] == ("ranked",)
+
+
+def select_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit="ppm", dataset=None,
+                search_mode="exact"):
+    """Return positions of the rows matching the user selections: sorted, or best first for a ranked search"""
+    dataset = dataset or current_dataset()
+
+    # Dropdown selections carry display strings; extract the actual values
+    return dataset.select({
+        'Contaminant': selected_values(contaminant) if contaminant else None,
+        'Commodity': selected_values(commodity) if commodity else None,
+        'Contaminant Level Type': selected_values(level_type) if level_type else None,
+    }, search_term, level_min, level_max, level_unit, search_mode=search_mode)
+
+
+def select_canonical(dataset, filters, row_ids=None):
+    """select_rows for a canonical_filters tuple, optionally limited to sorted row_ids"""
+    contaminants, commodities, level_types, search, level_range = filters
+    search_term, search_mode = search or ("", "exact")
+    level_min, level_max, level_unit = level_range or (None, None, "ppm")
+    return dataset.select({
+        'Contaminant': list(contaminants),
+        'Commodity': list(commodities),
+        'Contaminant Level Type': list(level_types),
+    }, search_term, level_min, level_max, level_unit, row_ids, search_mode)
+
+
+def matching_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit="ppm", dataset=None,
+                  search_mode="exact"):
+    """select_rows with the result cached by canonical filter state"""
+    dataset = dataset or current_dataset()
+    key = (canonical_filters(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, search_mode),
+           dataset.version)
+    row_ids = selection_cache.get(key)
+    if row_ids is None:
+        row_ids = select_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, dataset,
+                              search_mode)
+        selection_cache.put(key, row_ids, row_ids.nbytes)
+    return row_ids
+
+
+def filter_data(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit="ppm", dataset=None,
+                search_mode="exact"):
+    """Filter the dataframe based on user selections"""
+    dataset = dataset or current_dataset()
+    return dataset.take(select_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, dataset,
+                                    search_mode))
+
+
+def filter_stats(rows, dataset=None):
+    """Record count, distinct counts and most common values of selected rows ("N/A" when empty).
+
+    ``rows`` are row ids, or a DataFrame of dataset rows indexed by row id
+    as filter_data returns it. The figures are the selection_stats that
+    /api/stats serves, with "N/A" in place of None.
+    """
+    dataset = dataset or current_dataset()
+    row_ids = np.asarray(rows.index if hasattr(rows, 'index') else rows)
+    stats = selection_stats(CountCube(dataset.engine, row_ids))
+    return {key: "N/A" if value is None else value for key, value in stats.items()}
+
+
+def chart_data(chart_type, row_ids, dataset=None):
+    """Spec of a chart over the given rows, built from a single count cube"""
+    dataset = dataset or current_dataset()
+    return chart_spec(CountCube(dataset.engine, row_ids), chart_type)
@@ -0,0 +1,227 @@
+"""Fast, fault-tolerant parsing of the FDA CSV export.
+
+The export is read as bytes and its encoding detected (UTF-8, UTF-8 or
+UTF-16 with a byte order mark, else Windows-1252), so a file saved by a
+spreadsheet program parses the same as the original. Before parsing, one
+vectorized scan over the bytes finds every record boundary and counts its
+fields, honouring quoted fields. Records with the wrong number of fields
+are set aside as a quarantine report instead of failing the load or being
+silently padded. The well-formed records are parsed by pandas in chunks
+that run in parallel threads, across all the files being read.
+
+Text is then normalized once per distinct value: the non-breaking spaces
+of the export (including the ones an earlier lossy conversion turned into
+U+FFFD) become plain spaces, runs of whitespace collapse to one space, and
+values are stripped. "CPG 578.500" therefore matches the same reference
+typed with a normal space, and the same value is always one dictionary
+entry.
+"""
+import codecs
+import csv
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Bytes of well-formed records parsed per chunk
+CHUNK_BYTES = 16 << 20
+
+QUOTE, DELIMITER, NEWLINE = ord('"'), ord(','), ord('\n')
+
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# A replacement character standing for the micro sign in "µg/..."
+LOST_MICRO_SIGN = re.compile('�(?=g/)')
+# Whitespace runs, non-breaking spaces and replacement characters (lost non-breaking spaces)
+SPACE_RUN = re.compile('[\\s\xa0�]+')
+
+
+def detect_encoding(data):
+    """Encoding of raw CSV bytes: from a byte order mark, else UTF-8 if they decode, else Windows-1252"""
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if data.startswith(mark):
+            return encoding
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'cp1252'
+    return 'utf-8'
+
+
+def to_utf8(data):
+    """The bytes re-encoded as UTF-8 without a byte order mark, and the detected encoding"""
+    encoding = detect_encoding(data)
+    if encoding == 'utf-8':
+        return data, encoding
+    # Bytes Windows-1252 leaves undefined become replacement characters
+    return data.decode(encoding, errors='replace').encode('utf-8'), encoding
+
+
+def normalize_text(value):
+    """Repair lost micro signs, turn non-breaking spaces into spaces, collapse whitespace and strip"""
+    if not isinstance(value, str):
+        return value
+    return SPACE_RUN.sub(' ', LOST_MICRO_SIGN.sub('µ', value)).strip()
+
+
+def normalize_columns(df):
+    """Normalize every text column in place, once per distinct value"""
+    for column in df.columns:
+        if df[column].dtype == object:
+            codes, uniques = pd.factorize(df[column])
+            # Missing values have code -1, which picks the trailing NaN
+            cleaned = np.array([normalize_text(value) for value in uniques] + [np.nan], dtype=object)
+            df[column] = cleaned[codes]
+    return df
+
+
+def record_bounds(data, block_bytes=CHUNK_BYTES):
+    """Start and end offsets of every CSV record in ``data`` and its number of fields.
+
+    Line breaks and delimiters only count outside quotes, that is where an
+    even number of quote characters precede them (an escaped "" adds two).
+    The count comes from a binary search over the quote positions of each
+    block rather than a pass over every byte in Python.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    stops, delimiters = [], []
+    quotes_before = 0
+    for offset in range(0, len(buffer), block_bytes):
+        block = buffer[offset:offset + block_bytes]
+        quotes = np.flatnonzero(block == QUOTE)
+        for positions, found in ((np.flatnonzero(block == NEWLINE), stops),
+                                 (np.flatnonzero(block == DELIMITER), delimiters)):
+            outside = (np.searchsorted(quotes, positions) + quotes_before) % 2 == 0
+            found.append(positions[outside] + offset)
+        quotes_before += len(quotes)
+
+    stops = np.concatenate(stops) + 1 if stops else np.empty(0, dtype=np.int64)
+    if len(data) and (not len(stops) or stops[-1] != len(data)):
+        # The last record has no line break
+        stops = np.append(stops, len(data))
+    starts = np.concatenate(([0], stops[:-1])) if len(stops) else stops
+    fields = np.bincount(np.searchsorted(stops, np.concatenate(delimiters) if delimiters else [], side='right'),
+                         minlength=len(stops)) + 1
+    return starts, stops, fields[:len(stops)]
+
+
+def split_records(data, n_fields=None):
+    """Split CSV bytes into (column names or None, chunks of well-formed records, malformed records).
+
+    Without ``n_fields`` the first record is the header and sets the field
+    count. A record is malformed when it has another field count or opens
+    a quote that is never closed; such a record runs to the end of the
+    data, since line breaks inside quotes do not end it. Malformed records
+    are (line number, field count, raw text). Blank lines are left to the
+    parser, which skips them.
+    """
+    starts, stops, fields = record_bounds(data)
+    unterminated = np.count_nonzero(np.frombuffer(data, dtype=np.uint8) == QUOTE) % 2 == 1
+    names = None
+    first = 0
+    if n_fields is None:
+        if not len(stops):
+            raise ValueError("No columns to parse from file")
+        header = data[:stops[0]].decode('utf-8')
+        names = [name.strip() for name in next(csv.reader([header]))]
+        n_fields = len(names)
+        first = 1
+
+    bad = fields != n_fields
+    if unterminated and len(bad):
+        bad[-1] = True
+    malformed = np.flatnonzero(bad)
+    malformed = malformed[malformed >= first]
+    malformed = np.array([i for i in malformed if data[starts[i]:stops[i]].strip()], dtype=np.int64)
+
+    quarantine = []
+    if len(malformed):
+        newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == NEWLINE)
+        lines = np.searchsorted(newlines, starts[malformed]) + 1
+        quarantine = [
+            (int(line), int(fields[i]), data[starts[i]:stops[i]].decode('utf-8').rstrip('\r\n'))
+            for line, i in zip(lines, malformed)
+        ]
+
+    keep = np.ones(len(stops), dtype=bool)
+    keep[:first] = False
+    keep[malformed] = False
+    chunks = []
+    boundaries = np.searchsorted(stops, np.arange(CHUNK_BYTES, len(data), CHUNK_BYTES))
+    for begin, end in zip(np.concatenate(([first], boundaries)), np.concatenate((boundaries, [len(stops)]))):
+        if begin >= end:
+            continue
+        if keep[begin:end].all():
+            chunks.append(data[starts[begin]:stops[end - 1]])
+        else:
+            chunks.append(b''.join(data[starts[i]:stops[i]] for i in range(begin, end) if keep[i]))
+    return names, [chunk for chunk in chunks if chunk], quarantine
+
+
+def read_bytes(source):
+    """Raw bytes of a path, bytes object or file object (text is encoded as UTF-8)"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        data = source.read()
+        return data.encode('utf-8') if isinstance(data, str) else data
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def parse_chunk(chunk, names):
+    # Every source column is text, also in a handful of rows that happen to look numeric
+    return pd.read_csv(io.BytesIO(chunk), header=None, names=names, dtype=str, encoding='utf-8')
+
+
+def read_csv_sources(sources, names=None, workers=None):
+    """Parse and normalize CSV files into one table; return (table, quarantine report).
+
+    ``sources`` are paths, bytes or file objects with the same
+    columns. They are all split into chunks first, and the chunks are
+    parsed in ``workers`` threads (pandas releases the GIL while
+    tokenizing). Without ``names`` every source starts with a header row.
+    The report has one row per malformed record: source, line, fields and
+    the raw record.
+    """
+    columns = list(names) if names is not None else None
+    chunks = []
+    quarantine = []
+    for i, source in enumerate(sources):
+        data, _ = to_utf8(read_bytes(source))
+        header, source_chunks, malformed = split_records(data, None if names is None else len(columns))
+        if header is not None:
+            if columns is not None and header != columns:
+                raise ValueError(f"{source_name(source, i)} has columns {header}, expected {columns}")
+            columns = header
+        chunks += source_chunks
+        quarantine += [(source_name(source, i), *record) for record in malformed]
+
+    with ThreadPoolExecutor(workers or min(len(chunks), os.cpu_count() or 1) or 1) as pool:
+        frames = list(pool.map(lambda chunk: parse_chunk(chunk, columns), chunks))
+    if frames:
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    else:
+        df = pd.DataFrame({column: pd.Series(dtype=object) for column in columns or []})
+
+    report = pd.DataFrame(quarantine, columns=['source', 'line', 'fields', 'record'])
+    return normalize_columns(df), report
+
+
+def source_name(source, i):
+    return source if isinstance(source, str) else f"source {i + 1}"
+
+
+def write_quarantine(report, path):
+    """Write the quarantine report to ``path``, or remove an old one when nothing was quarantined"""
+    if len(report):
+        report.to_csv(path, index=False)
+    elif os.path.exists(path):
+        os.remove(path)
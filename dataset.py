@@ -0,0 +1,279 @@
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from caching import FileCursor, file_digest
+from column_store import ColumnStore
+from csv_source import read_csv_sources, write_quarantine
+from filter_engine import FilterEngine
+from level_parser import LEVEL_COLUMNS, add_level_columns, level_range_mask
+from name_matcher import build_matcher
+from paging import TablePager
+from ranked_search import RankedSearch
+from search_index import SearchIndex
+from snapshot import SNAPSHOT_DIR, publish_snapshot, read_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Path of the FDA export the app serves
+DATA_PATH = 'data/contaminant-levels.csv'
+
+# Columns that identify a record; no two rows should share all of them
+KEY_COLUMNS = ['Contaminant', 'Commodity', 'Reference']
+
+
+def last_modified_date_of(path):
+    last_modified = os.path.getmtime(path)
+    return datetime.fromtimestamp(last_modified).strftime('%Y-%m-%d')
+
+
+def quarantine_path(path):
+    """Where the malformed rows of a CSV are reported: next to it, as <name>.quarantine.csv"""
+    return f"{os.path.splitext(path)[0]}.quarantine.csv"
+
+
+# Parse and clean the CSV
+def read_csv_data(path=DATA_PATH, names=None):
+    """Parse and clean a CSV, or a list of CSVs with the same columns (parsed in parallel).
+
+    With ``names`` the files have no header row (e.g. rows appended to the
+    file). Rows with the wrong number of fields are left out, logged and
+    written to the quarantine report of their file.
+    """
+    sources = path if isinstance(path, (list, tuple)) else [path]
+    df, quarantine = read_csv_sources(sources, names)
+    for source, report in quarantine.groupby('source', sort=False):
+        logger.warning("Quarantined %d malformed rows of %s (lines %s)", len(report), source,
+                       ", ".join(str(line) for line in report['line'].head(10)))
+    for source in sources:
+        if isinstance(source, str):
+            write_quarantine(quarantine[quarantine['source'] == source], quarantine_path(source))
+
+    # Parse Level strings into typed value/unit columns once at load time
+    df = add_level_columns(df)
+
+    return df
+
+
+# Load and preprocess the data
+def load_data(path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR):
+    """Return the cleaned table and the date the CSV was last modified.
+
+    The table comes from the binary snapshot when one was built for the
+    current CSV contents, and from parsing the CSV otherwise.
+    """
+    store = read_snapshot(snapshot_dir, file_digest(path))
+    df = store.to_frame() if store else read_csv_data(path)
+
+    # Add date of last update info
+    return df, last_modified_date_of(path)
+
+
+def publish_store(version, build, snapshot_dir=SNAPSHOT_DIR):
+    """The memory-mapped snapshot of ``version``, published from ``build()`` if needed; None if it can't be written"""
+    try:
+        return publish_snapshot(version, build, snapshot_dir)
+    except OSError:
+        logger.warning("Could not publish a snapshot of version %s to %s; serving it from memory", version,
+                       snapshot_dir, exc_info=True)
+        return None
+
+
+def option_choices(categories, counts):
+    """("Value (count)", value) dropdown choices sorted by value"""
+    items = sorted((value, int(count)) for value, count in zip(categories, counts) if not pd.isna(value))
+    return [(f"{value} ({count})", value) for value, count in items]
+
+
+class Dataset:
+    """The cleaned table together with everything derived from it.
+
+    Holds the column store, filter engine, search index, level arrays and
+    table pager the request handlers work on, plus the dataset version
+    (content hash of the CSV) that cache keys carry. A Dataset is never
+    modified once built, so a request can keep using one while a newer one
+    is swapped in. Rows are materialized with ``take`` for the row ids a
+    request needs; when the store is mapped from a snapshot, the per-row
+    arrays are shared with every other process serving the same version.
+    """
+
+    def __init__(self, store, last_modified_date, version, cursor=None, base=None):
+        self.store = store
+        self.columns = store.columns
+        self.last_modified_date = last_modified_date
+        self.version = version
+        # How far the CSV has been read, to pick up appended rows without a full load
+        self.cursor = cursor
+        # The dataset this one extends with appended rows: its version and row count
+        self.base_version = base.version if base else None
+        self.base_rows = len(base.store) if base else None
+
+        # The parsed level columns are derived from Level, so only the
+        # source columns are searched
+        self.source_columns = [column for column in store.columns if column not in LEVEL_COLUMNS]
+        self.engine = FilterEngine(store, columns=self.source_columns + ['Level Unit'], indexes=store.indexes)
+        if base:
+            self.search_index = base.search_index.extended(self.engine)
+        else:
+            self.search_index = SearchIndex(self.engine, columns=self.source_columns)
+        self.level_values = store.values['Level Value']
+
+        # Table pages are cut from selected row ids; Level sorts by unit family, then canonical value
+        self.pager = TablePager(self.engine, sort_keys={
+            'Level': lambda: [self.engine.columns['Level Unit'].codes, self.level_values],
+        })
+        self.options = {}
+        self.matchers = {}
+        self._ranked_search = None
+
+    @classmethod
+    def from_frame(cls, df, last_modified_date, version):
+        return cls(ColumnStore.from_frame(df), last_modified_date, version)
+
+    @property
+    def df(self):
+        """The whole table as a DataFrame; a full copy, so request paths use take"""
+        return self.store.to_frame()
+
+    def take(self, row_ids, columns=None):
+        """DataFrame of the given rows and columns"""
+        return self.store.take(row_ids, columns)
+
+    def filter_options(self, column):
+        """Sorted ("Value (count)", value) dropdown choices for a column, computed once"""
+        if column not in self.options:
+            index = self.engine.columns[column]
+            self.options[column] = option_choices(index.categories, index.counts)
+        return self.options[column]
+
+    def name_matcher(self, column):
+        """NameMatcher for free-text names of a column's values, built once from the values and synonym file"""
+        if column not in self.matchers:
+            self.matchers[column] = build_matcher(self, column)
+        return self.matchers[column]
+
+    def ranked_search(self):
+        """RankedSearch over the text columns, built on the first ranked search"""
+        if self._ranked_search is None:
+            self._ranked_search = RankedSearch(self.engine)
+        return self._ranked_search
+
+    def facet_options(self, filters, search_term=None, level_min=None, level_max=None, level_unit="ppm",
+                      search_mode="exact"):
+        """Dropdown choices for every column in ``filters``, counted under the other active filters.
+
+        Counts follow the search term and level range too; a ranked search
+        counts every row it scores, not only the top rows. Every value stays
+        in the choices, in the same order, so a value that would match no
+        row shows "(0)" instead of disappearing from under a selection.
+        """
+        rows = None
+        if search_term and search_mode == "ranked":
+            rows = self.select({}, None, level_min, level_max, level_unit)
+            rows = self.ranked_search().search(search_term, rows, k=None)[0]
+        elif search_term or level_min is not None or level_max is not None:
+            rows = self.select({}, search_term, level_min, level_max, level_unit)
+        counts = self.engine.facet_counts({column: values or None for column, values in filters.items()}, rows)
+        return {
+            column: option_choices(self.engine.columns[column].categories, column_counts)
+            for column, column_counts in counts.items()
+        }
+
+    def select(self, filters, search_term=None, level_min=None, level_max=None, level_unit="ppm", row_ids=None,
+               search_mode="exact"):
+        """Sorted row ids matching raw column values, a search term and a level range.
+
+        ``filters`` maps columns to lists of accepted values; None or an
+        empty list leaves a column unconstrained. Given sorted ``row_ids``,
+        only those rows are considered. With ``search_mode`` "ranked", the
+        search term selects the TOP_K best matching rows instead, typos
+        allowed, and they are returned best first.
+        """
+        row_ids = self.engine.select({column: values or None for column, values in filters.items()}, row_ids)
+        
+        # Apply search term across all columns
+        if search_term and search_mode == "ranked":
+            # The level range filters first, so the top rows are taken from rows that pass it
+            row_ids = self.select({}, None, level_min, level_max, level_unit, row_ids)
+            return self.ranked_search().search(search_term, row_ids)[0]
+        if search_term:
+            row_ids = self.search_index.search(search_term, row_ids)
+        
+        # Filter by level within one unit family, comparing canonical values
+        if level_min is not None or level_max is not None:
+            units = self.engine.columns['Level Unit']
+            unit_code = units.code_of(level_unit)
+            if unit_code is None:
+                return row_ids[:0]
+            row_ids = row_ids[level_range_mask(
+                self.level_values[row_ids], units.codes[row_ids], unit_code, level_min, level_max
+            )]
+        
+        return row_ids
+
+    def duplicate_keys(self, rows):
+        """Boolean mask of the ``rows`` whose KEY_COLUMNS are taken by this dataset or an earlier row"""
+        existing = [
+            len(self.engine.select({column: [value] for column, value in zip(KEY_COLUMNS, key)})) > 0
+            for key in rows[KEY_COLUMNS].itertuples(index=False)
+        ]
+        return np.array(existing, dtype=bool) | rows.duplicated(KEY_COLUMNS).to_numpy()
+
+    def append(self, rows, version, last_modified_date=None, cursor=None, snapshot_dir=None):
+        """New dataset with the cleaned ``rows`` added after the last row.
+
+        The dictionaries, posting lists, counts and search index are
+        extended with the new rows only; this dataset is left as it is.
+        Given ``snapshot_dir``, the extended store is published as the
+        snapshot of ``version`` and served memory-mapped from there, like a
+        loaded one.
+        """
+        store = self.store.append(rows)
+        if snapshot_dir is not None:
+            store = publish_store(version, lambda: store, snapshot_dir) or store
+        return Dataset(store, last_modified_date or self.last_modified_date, version, cursor, base=self)
+
+    def extend(self, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, publish=True):
+        """This dataset plus the rows appended to its CSV since it was read.
+
+        Only the appended bytes are parsed and indexed. With ``publish``,
+        the result is published and mapped as the snapshot of the new
+        version (see ``append``). Returns None when the file was changed in
+        any other way, which needs a full load.
+        """
+        appended = self.cursor.appended(path) if self.cursor else None
+        if appended is None:
+            return None
+        data, cursor = appended
+        rows, quarantine = read_csv_sources([data], self.source_columns)
+        if len(quarantine):
+            logger.warning("Quarantined %d malformed rows appended to %s: %s", len(quarantine), path,
+                           "; ".join(quarantine['record'].head(10)))
+        rows = add_level_columns(rows)
+
+        duplicates = int(self.duplicate_keys(rows).sum())
+        if duplicates:
+            logger.warning("%d of the %d rows appended to %s repeat an existing %s", duplicates, len(rows), path,
+                           "/".join(KEY_COLUMNS))
+        return self.append(rows, cursor.version, last_modified_date_of(path), cursor,
+                           snapshot_dir if publish else None)
+
+    @classmethod
+    def load(cls, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, publish=True):
+        """Load from the snapshot matching the CSV's content hash, else from the CSV.
+
+        With ``publish``, a CSV version without a snapshot is parsed once,
+        written as the snapshot and served from there, so every process
+        loading it maps the same files instead of holding its own copy.
+        """
+        cursor = FileCursor.open(path)
+        version = cursor.version
+        store = read_snapshot(snapshot_dir, version)
+        if store is None and publish:
+            store = publish_store(version, lambda: ColumnStore.from_frame(read_csv_data(path)), snapshot_dir)
+        if store is None:
+            store = ColumnStore.from_frame(read_csv_data(path))
+        return cls(store, last_modified_date_of(path), version, cursor)
@@ -0,0 +1,76 @@
+"""Streaming export of a row selection as CSV, NDJSON or Parquet.
+
+Rows are serialized in fixed-size chunks taken straight from the column
+store by row id, so memory stays flat however large the selection is and
+the first chunk can be sent before the rest has been read. Parquet needs pyarrow,
+which is optional; without it only CSV and NDJSON are offered.
+"""
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Rows serialized per chunk (and per Parquet row group)
+EXPORT_CHUNK_ROWS = 10000
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_formats():
+    """Formats available in this installation"""
+    return [name for name in EXPORT_MEDIA_TYPES if name != 'parquet' or pq is not None]
+
+
+def iter_chunks(store, row_ids, columns, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, len(row_ids), chunk_rows):
+        yield store.take(row_ids[start:start + chunk_rows], columns)
+
+
+def stream_csv(store, row_ids, columns, chunk_rows=EXPORT_CHUNK_ROWS):
+    # The header goes out even for an empty selection
+    yield store.take(row_ids[:0], columns).to_csv(index=False)
+    for chunk in iter_chunks(store, row_ids, columns, chunk_rows):
+        yield chunk.to_csv(index=False, header=False)
+
+
+def stream_ndjson(store, row_ids, columns, chunk_rows=EXPORT_CHUNK_ROWS):
+    for chunk in iter_chunks(store, row_ids, columns, chunk_rows):
+        yield chunk.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n') + '\n'
+
+
+def stream_parquet(store, row_ids, columns, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Fix the schema up front; a chunk whose text column is all missing would otherwise infer a null type
+    schema = pa.schema([
+        (column, pa.string() if store.dtype(column) == object else pa.from_numpy_dtype(store.dtype(column)))
+        for column in columns
+    ])
+    sink = io.BytesIO()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in iter_chunks(store, row_ids, columns, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            # Hand over each finished row group and start the buffer again
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'parquet': stream_parquet,
+}
+
+
+def stream_export(store, row_ids, columns, fmt):
+    """Iterator over the encoded chunks of the selected rows in the given format"""
+    if fmt not in export_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return STREAMERS[fmt](store, row_ids, columns)
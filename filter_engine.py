@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+# Columns exposed as multi-select filters in the UI
+FILTER_COLUMNS = ['Contaminant', 'Commodity', 'Contaminant Level Type']
+
+EMPTY_ROWS = np.empty(0, dtype=np.int32)
+
+
+class ColumnIndex:
+    """Categorical codes for one column plus an inverted row-id index per value.
+
+    Row ids for each value are stored as one sorted posting list inside a
+    single CSR-style layout (``order`` grouped by code, sliced with
+    ``offsets``), so the whole index costs two int32 arrays per column no
+    matter how many distinct values there are.
+    """
+
+    def __init__(self, codes, categories, order=None):
+        self.codes = codes
+        self.categories = list(categories)
+        self.lookup = {value: code for code, value in enumerate(self.categories)}
+
+        self.counts = np.bincount(self.codes, minlength=len(self.categories))
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        if order is None:
+            # A stable sort keeps row ids ascending inside every posting list
+            order = np.argsort(self.codes, kind='stable').astype(np.int32)
+        self.order = order
+        # Row ids appended after the CSR layout was built, keyed by code
+        self.extra = {}
+        self._labels = None
+
+    @classmethod
+    def from_values(cls, values):
+        """Encode a column; codes follow the order values first appear in"""
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        return cls(codes.astype(np.int32), uniques)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def copy(self):
+        """Index to append to without changing this one; arrays are shared, not copied"""
+        index = ColumnIndex.__new__(ColumnIndex)
+        index.__dict__.update(self.__dict__)
+        index.categories = list(self.categories)
+        index.lookup = dict(self.lookup)
+        index.extra = dict(self.extra)
+        return index
+
+    def posting_order(self):
+        """Row ids grouped by code including appended rows, as ``order`` of a freshly built index.
+
+        Appended rows come after every row of ``order``, so each posting list
+        is its slice of ``order`` followed by its ``extra`` rows; the lists are
+        moved to their new offsets in one pass instead of sorting the codes.
+        """
+        if not self.extra:
+            return self.order
+        offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        built_counts = np.diff(self.offsets)
+        merged = np.empty(len(self.codes), dtype=np.int32)
+        shift = offsets[:len(built_counts)] - self.offsets[:-1]
+        merged[np.arange(len(self.order)) + np.repeat(shift, built_counts)] = self.order
+        for code, rows in self.extra.items():
+            merged[offsets[code + 1] - len(rows):offsets[code + 1]] = rows
+        return merged
+
+    def labels(self):
+        """Categories as an object array, for turning codes back into values"""
+        if self._labels is None or len(self._labels) != len(self.categories):
+            self._labels = np.empty(len(self.categories), dtype=object)
+            self._labels[:] = self.categories
+        return self._labels
+
+    def code_of(self, value):
+        """Code of a single value; all missing values share one code"""
+        if pd.isna(value):
+            return next((code for code, v in enumerate(self.categories) if pd.isna(v)), None)
+        return self.lookup.get(value)
+
+    def codes_for(self, values):
+        """Map raw values to their codes, skipping values that never occur"""
+        codes = [self.lookup.get(value) for value in values]
+        return [code for code in codes if code is not None]
+
+    def postings(self, code):
+        """Sorted row ids holding the value with the given code"""
+        if code + 1 < len(self.offsets):
+            rows = self.order[self.offsets[code]:self.offsets[code + 1]]
+        else:
+            rows = EMPTY_ROWS
+        if code in self.extra:
+            rows = np.concatenate((rows, self.extra[code]))
+        return rows
+
+    def append(self, values):
+        """Index rows appended after the current last row.
+
+        New values get new codes at the end of ``categories``; their row ids
+        go to ``extra`` so the existing posting lists are left untouched.
+        """
+        start = len(self.codes)
+        local_codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = self.code_of(value)
+            if code is None:
+                code = len(self.categories)
+                self.categories.append(value)
+                self.lookup[value] = code
+            mapping[i] = code
+        new_codes = mapping[local_codes]
+
+        self.codes = np.concatenate((self.codes, new_codes))
+        self.counts = np.bincount(new_codes, minlength=len(self.categories)) + np.pad(
+            self.counts, (0, len(self.categories) - len(self.counts)))
+
+        row_ids = np.arange(start, start + len(values), dtype=np.int32)
+        order = np.argsort(new_codes, kind='stable')
+        codes, starts = np.unique(new_codes[order], return_index=True)
+        for code, rows in zip(codes, np.split(row_ids[order], starts[1:])):
+            code = int(code)
+            if code in self.extra:
+                rows = np.concatenate((self.extra[code], rows))
+            self.extra[code] = rows
+
+    def rows_for(self, values):
+        """Sorted row ids holding any of the given values (posting list union)"""
+        codes = self.codes_for(values)
+        if not codes:
+            return EMPTY_ROWS
+        if len(codes) == 1:
+            return self.postings(codes[0])
+        return np.sort(np.concatenate([self.postings(code) for code in codes]))
+
+    def mask_for(self, values):
+        """Boolean lookup table over codes that is True for the given values"""
+        allowed = np.zeros(len(self.categories), dtype=bool)
+        allowed[self.codes_for(values)] = True
+        return allowed
+
+    def count_for(self, values):
+        return int(sum(self.counts[code] for code in self.codes_for(values)))
+
+
+class FilterEngine:
+    """Pre-indexed row selection over categorical columns.
+
+    Built once when the data is loaded. Selections are expressed as sorted
+    arrays of row positions so only the final result has to be materialized
+    into a DataFrame. Every indexed column can be filtered on; the search
+    index reuses the same column indexes for its row lookups.
+    """
+
+    def __init__(self, df, columns=None, indexes=None):
+        if columns is None:
+            columns = list(df.columns)
+        # Prebuilt column indexes, e.g. loaded from a snapshot, skip the encoding pass
+        indexes = indexes or {}
+        self.n_rows = len(df)
+        self.columns = {
+            column: indexes[column] if column in indexes else ColumnIndex.from_values(df[column])
+            for column in columns
+        }
+
+    def append(self, new_df):
+        """Index rows added to the end of the table"""
+        for column, index in self.columns.items():
+            index.append(new_df[column].tolist())
+        self.n_rows += len(new_df)
+
+    def all_rows(self):
+        return np.arange(self.n_rows, dtype=np.int32)
+
+    def facet_counts(self, filters, rows=None):
+        """Row counts per code of every column in ``filters``, each under all the *other* filters.
+
+        This is how search-engine facets count: a column's counts show how
+        many rows each of its values would match given everything else that
+        is selected. One pass over the candidate ``rows`` (default: all)
+        finds which filters every row fails; a row counts toward a column
+        when it fails no filter or only that column's, so each facet is a
+        single bincount over the column's codes.
+        """
+        rows = self.all_rows() if rows is None else rows
+        failed = {}
+        n_failed = np.zeros(len(rows), dtype=np.int32)
+        for column, values in filters.items():
+            if values:
+                index = self.columns[column]
+                failed[column] = ~index.mask_for(values)[index.codes[rows]]
+                n_failed += failed[column]
+
+        counts = {}
+        for column in filters:
+            index = self.columns[column]
+            counted = n_failed == failed[column] if column in failed else n_failed == 0
+            counts[column] = np.bincount(index.codes[rows[counted]], minlength=len(index.categories))
+        return counts
+
+    def select(self, filters, rows=None):
+        """Return sorted row ids matching every ``{column: [values]}`` filter.
+
+        Columns with an empty value list are not filtered. The most selective
+        filter produces the candidate rows through a posting list union; the
+        remaining filters are intersected by probing each candidate's code
+        against a per-column lookup table, so the cost follows the size of
+        the selection rather than the size of the table. Given sorted
+        ``rows``, only those are candidates.
+        """
+        active = [(column, values) for column, values in filters.items() if values]
+        if rows is None:
+            if not active:
+                return self.all_rows()
+            active.sort(key=lambda item: self.columns[item[0]].count_for(item[1]))
+            first_column, first_values = active.pop(0)
+            rows = self.columns[first_column].rows_for(first_values)
+
+        for column, values in active:
+            if len(rows) == 0:
+                break
+            index = self.columns[column]
+            rows = rows[index.mask_for(values)[index.codes[rows]]]
+
+        return rows
@@ -1,10 +1,23 @@
 import gradio as gr
-import pandas as pd
-import numpy as np
+import html
+import logging
 import os
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-from datetime import datetime
+from contextlib import nullcontext
+from urllib.parse import urlencode
+import uvicorn
+from fastapi import FastAPI
+
+from api import create_api
+from core import (canonical_filters, chart_data, current_dataset, dataset_caches, filter_stats, get_filter_options,
+                  matching_rows, result_caches, selected_values, selection_cache)
+from export import export_formats
+from filter_engine import FILTER_COLUMNS
+from caching import LRUCache
+from charts import chart_output, message_spec, render_chart
+from coalescing import RequestCoalescer, Superseded
+from instrumentation import Metrics, RequestMetrics, RequestProfiler, RequestTrace, add_metrics_routes, filter_shape
+from render_pool import RenderPool, RenderPoolBusy, RenderTimeout
+from level_parser import UNIT_FAMILIES
 
 # Set page configuration
 page_title = "FDA Food Contaminants Explorer"
@@ -101,445 +114,355 @@ h1, h2, h3, h4 {
 }
 """
 
-# Load and preprocess the data
-def load_data():
-    df = pd.read_csv('data/contaminant-levels.csv')
-    
-    # Clean column names and data
-    df.columns = df.columns.str.strip()
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            df[col] = df[col].str.strip()
-    
-    # Add date of last update info
-    last_modified = os.path.getmtime('data/contaminant-levels.csv')
-    last_modified_date = datetime.fromtimestamp(last_modified).strftime('%Y-%m-%d')
-    
-    return df, last_modified_date
+# Memory budget for rendered charts, configurable through the environment
+FIGURE_CACHE_BYTES = int(os.environ.get('FIGURE_CACHE_MB', '64')) * 1024 * 1024
+RESULT_CACHE_BYTES = int(os.environ.get('RESULT_CACHE_MB', '128')) * 1024 * 1024
+FACET_CACHE_BYTES = int(os.environ.get('FACET_CACHE_MB', '16')) * 1024 * 1024
 
-df, last_modified_date = load_data()
+# How long a filter change waits for newer changes from the same session before running,
+# and how many events the queue works on at once
+COALESCE_DELAY_MS = int(os.environ.get('COALESCE_DELAY_MS', '150'))
+QUEUE_CONCURRENCY = int(os.environ.get('QUEUE_CONCURRENCY', '4'))
 
-# Get unique values for filters with counts
-def get_filter_options(column):
-    """Get sorted filter options with counts for a given column"""
-    value_counts = df[column].value_counts().sort_index()
-    # For compatibility with different pandas/gradio versions
-    try:
-        # Newer pandas versions
-        items = value_counts.items()
-    except AttributeError:
-        # Older pandas versions
-        items = zip(value_counts.index, value_counts.values)
-    return [f"{value} ({count})" for value, count in items]
-
-# Extract the actual value from a filter option string like "Value (123)"
-def extract_value(option):
-    if not option:
-        return None
-    return option.split(" (")[0]
-
-# Define filter options
+# Default chart backend: "plotly" draws charts in the browser, "matplotlib" renders images on the server
+CHART_BACKEND = os.environ.get('CHART_BACKEND', 'plotly')
+
+# Server-side (matplotlib) charts are rendered by this many worker processes; 0 renders on the request thread.
+# Renders beyond RENDER_QUEUE_LIMIT in flight are turned away, and a render is abandoned after RENDER_TIMEOUT_S.
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '0'))
+RENDER_QUEUE_LIMIT = int(os.environ.get('RENDER_QUEUE_LIMIT', str(4 * RENDER_WORKERS)))
+RENDER_TIMEOUT_S = float(os.environ.get('RENDER_TIMEOUT_S', '10'))
+
+# Requests slower than SLOW_REQUEST_MS are logged with their inputs and stage timings. With PROFILE_DIR set,
+# POST /debug/profile?count=N profiles the next N requests into that directory.
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '1000'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+
+# Address the UI and API are served on
+SERVER_NAME = os.environ.get('GRADIO_SERVER_NAME', '127.0.0.1')
+SERVER_PORT = int(os.environ.get('GRADIO_SERVER_PORT', '7860'))
+
+# Define filter options (refreshed from the current dataset whenever the page loads)
 contaminant_options = [""] + get_filter_options('Contaminant')
 commodity_options = [""] + get_filter_options('Commodity')
 level_type_options = [""] + get_filter_options('Contaminant Level Type')
 
-# Filter data based on selections
-def filter_data(contaminant, commodity, level_type, search_term, level_min, level_max):
-    """Filter the dataframe based on user selections"""
-    filtered_df = df.copy()
-    
-    # Apply dropdown filters (extract actual values from the display strings)
-    if contaminant:
-        # Handle single item or list of items
-        if isinstance(contaminant, list):
-            # Multiple contaminants selected
-            contaminant_values = [extract_value(c) for c in contaminant]
-            filtered_df = filtered_df[filtered_df['Contaminant'].isin(contaminant_values)]
-        else:
-            # Single contaminant selected
-            contaminant_value = extract_value(contaminant)
-            filtered_df = filtered_df[filtered_df['Contaminant'] == contaminant_value]
-    
-    if commodity:
-        # Handle single item or list of items
-        if isinstance(commodity, list):
-            # Multiple commodities selected
-            commodity_values = [extract_value(c) for c in commodity]
-            filtered_df = filtered_df[filtered_df['Commodity'].isin(commodity_values)]
-        else:
-            # Single commodity selected
-            commodity_value = extract_value(commodity)
-            filtered_df = filtered_df[filtered_df['Commodity'] == commodity_value]
-    
-    if level_type:
-        # Handle single item or list of items
-        if isinstance(level_type, list):
-            # Multiple level types selected
-            level_type_values = [extract_value(lt) for lt in level_type]
-            filtered_df = filtered_df[filtered_df['Contaminant Level Type'].isin(level_type_values)]
-        else:
-            # Single level type selected
-            level_type_value = extract_value(level_type)
-            filtered_df = filtered_df[filtered_df['Contaminant Level Type'] == level_type_value]
-    
-    # Apply search term across all columns
-    if search_term:
-        search_mask = filtered_df.apply(
-            lambda row: any(search_term.lower() in str(cell).lower() for cell in row),
-            axis=1
-        )
-        filtered_df = filtered_df[search_mask]
-    
-    # Try to numerically filter by level if possible
-    if level_min is not None or level_max is not None:
-        # Try to extract numeric values from the Level column
-        numeric_levels = []
-        for level in filtered_df['Level']:
-            # Extract numbers from strings like "1 ppm" or "0.5 mg/kg"
-            try:
-                num = float(''.join([c for c in level if c.isdigit() or c == '.']))
-                numeric_levels.append(num)
-            except:
-                numeric_levels.append(None)
-        
-        filtered_df['NumericLevel'] = numeric_levels
-        
-        # Apply numeric filters if values are not None
-        if level_min is not None:
-            filtered_df = filtered_df[filtered_df['NumericLevel'] >= level_min]
-        
-        if level_max is not None:
-            filtered_df = filtered_df[filtered_df['NumericLevel'] <= level_max]
-        
-        # Drop the temporary column
-        filtered_df = filtered_df.drop('NumericLevel', axis=1)
-    
-    return filtered_df
+def facet_updates(dataset, contaminant, commodity, level_type, search_term, level_min, level_max, level_unit="ppm",
+                  search_mode="exact"):
+    """Dropdown updates whose choices count the rows each value would match under the other filters"""
+    filters = {
+        column: [value for value in selected_values(option) if value is not None] if option else None
+        for column, option in zip(FILTER_COLUMNS, [contaminant, commodity, level_type])
+    }
+    options = dataset.facet_options(filters, search_term, level_min, level_max, level_unit, search_mode)
+    return tuple(gr.update(choices=[""] + options[column]) for column in FILTER_COLUMNS)
 
 # Data analysis functions
-def calculate_stats(filtered_df):
-    """Calculate statistics for the filtered data"""
-    total_records = len(filtered_df)
-    unique_contaminants = filtered_df['Contaminant'].nunique()
-    unique_commodities = filtered_df['Commodity'].nunique()
-    
-    if total_records > 0:
-        # Find most common values
-        most_common_contaminant = filtered_df['Contaminant'].value_counts().idxmax()
-        most_common_commodity = filtered_df['Commodity'].value_counts().idxmax()
-        most_common_level_type = filtered_df['Contaminant Level Type'].value_counts().idxmax()
-    else:
-        most_common_contaminant = "N/A"
-        most_common_commodity = "N/A"
-        most_common_level_type = "N/A"
+def calculate_stats(dataset, row_ids):
+    """Calculate statistics for the selected rows"""
+    stats = filter_stats(row_ids, dataset)
     
     stats_html = f"""
     <div class="data-stats">
-        <div><strong>Records:</strong> {total_records}</div>
-        <div><strong>Unique Contaminants:</strong> {unique_contaminants}</div>
-        <div><strong>Unique Commodities:</strong> {unique_commodities}</div>
-        <div><strong>Most Common Contaminant:</strong> {most_common_contaminant}</div>
-        <div><strong>Most Common Commodity:</strong> {most_common_commodity}</div>
-        <div><strong>Most Common Level Type:</strong> {most_common_level_type}</div>
+        <div><strong>Records:</strong> {stats['records']}</div>
+        <div><strong>Unique Contaminants:</strong> {stats['unique_contaminant_count']}</div>
+        <div><strong>Unique Commodities:</strong> {stats['unique_commodity_count']}</div>
+        <div><strong>Most Common Contaminant:</strong> {stats['most_common_contaminant']}</div>
+        <div><strong>Most Common Commodity:</strong> {stats['most_common_commodity']}</div>
+        <div><strong>Most Common Level Type:</strong> {stats['most_common_level_type']}</div>
     </div>
     """
     
     return stats_html
 
-# Visualization Functions using Matplotlib
-def create_contaminant_bar(filtered_df):
-    """Create a bar chart of top contaminants using Matplotlib"""
-    if filtered_df.empty:
-        fig = Figure(figsize=(10, 6))
-        ax = fig.add_subplot(111)
-        ax.text(0.5, 0.5, "No data available for visualization", 
-                ha='center', va='center', fontsize=14)
-        ax.axis('off')
-        return fig
-    
-    counts = filtered_df['Contaminant'].value_counts().nlargest(15)
-    
-    fig = Figure(figsize=(10, 6))
-    ax = fig.add_subplot(111)
-    
-    # Create the bar chart
-    bars = ax.bar(counts.index, counts.values, color='#1f77b4')
-    
-    # Style the chart
-    ax.set_title('Top 15 Contaminants by Frequency', fontsize=16)
-    ax.set_xlabel('Contaminant')
-    ax.set_ylabel('Count')
-    ax.tick_params(axis='x', rotation=45)
-    
-    # Add labels to the bars
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                f'{int(height)}', ha='center', va='bottom')
-    
-    fig.tight_layout()
-    return fig
-
-def create_commodity_bar(filtered_df):
-    """Create a bar chart of top commodities using Matplotlib"""
-    if filtered_df.empty:
-        fig = Figure(figsize=(10, 6))
-        ax = fig.add_subplot(111)
-        ax.text(0.5, 0.5, "No data available for visualization", 
-                ha='center', va='center', fontsize=14)
-        ax.axis('off')
-        return fig
-    
-    counts = filtered_df['Commodity'].value_counts().nlargest(15)
-    
-    fig = Figure(figsize=(10, 6))
-    ax = fig.add_subplot(111)
-    
-    # Create the bar chart
-    bars = ax.bar(counts.index, counts.values, color='#2ca02c')
-    
-    # Style the chart
-    ax.set_title('Top 15 Commodities by Frequency', fontsize=16)
-    ax.set_xlabel('Commodity')
-    ax.set_ylabel('Count')
-    ax.tick_params(axis='x', rotation=45)
-    
-    # Add labels to the bars
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                f'{int(height)}', ha='center', va='bottom')
-    
-    fig.tight_layout()
-    return fig
-
-def create_level_type_pie(filtered_df):
-    """Create a pie chart of level types using Matplotlib"""
-    if filtered_df.empty:
-        fig = Figure(figsize=(10, 6))
-        ax = fig.add_subplot(111)
-        ax.text(0.5, 0.5, "No data available for visualization", 
-                ha='center', va='center', fontsize=14)
-        ax.axis('off')
-        return fig
-    
-    counts = filtered_df['Contaminant Level Type'].value_counts()
-    
-    fig = Figure(figsize=(10, 6))
-    ax = fig.add_subplot(111)
-    
-    # Create the pie chart
-    wedges, texts, autotexts = ax.pie(
-        counts.values, 
-        labels=counts.index, 
-        autopct='%1.1f%%',
-        startangle=90, 
-        shadow=False
+# Rendered charts keyed by (canonical filters, chart type, backend, dataset version)
+figure_cache = LRUCache(FIGURE_CACHE_BYTES)
+
+# Worker processes for matplotlib renders, so concurrent renders do not serialize on the GIL
+render_pool = RenderPool(RENDER_WORKERS, RENDER_QUEUE_LIMIT, RENDER_TIMEOUT_S) if RENDER_WORKERS > 0 else None
+
+def cached_visualization(dataset, filters, chart_type, row_ids, chart_backend=CHART_BACKEND, trace=None):
+    """Return the chart for a filter state, rendering it only on a cache miss"""
+    trace = trace or RequestTrace()
+    key = (filters, chart_type, chart_backend, dataset.version)
+    rendered = figure_cache.get(key)
+    if rendered is None:
+        # Build the chart spec from a single count cube over the selected rows
+        with trace.stage('chart_spec', len(row_ids)):
+            spec = chart_data(chart_type, row_ids, dataset)
+        render_stage = trace.stage(f'chart_render_{chart_backend}')
+        if render_pool and chart_backend == 'matplotlib':
+            try:
+                with render_stage:
+                    rendered = render_pool.render(spec)
+            except (RenderPoolBusy, RenderTimeout):
+                # Shed the render rather than queue it; nothing is cached, so a redraw retries
+                busy = message_spec("The server is busy rendering charts. Click Redraw Visualization to try again.")
+                return chart_output(render_chart(busy, chart_backend), chart_backend)
+            except RuntimeError as e:
+                failed = message_spec(f"Error creating visualization: {str(e)}")
+                return chart_output(render_chart(failed, chart_backend), chart_backend)
+        else:
+            with render_stage:
+                rendered = render_chart(spec, chart_backend)
+        figure_cache.put(key, rendered, len(rendered))
+    return chart_output(rendered, chart_backend)
+
+# Table columns shown in the data table, with their display names
+TABLE_COLUMNS = {
+    'Contaminant': 'Contaminant',
+    'Commodity': 'Commodity',
+    'Contaminant Level Type': 'Level Type',
+    'Level': 'Level',
+    'Reference': 'Reference',
+    'Link to Reference': 'Link',
+}
+PAGE_SIZES = [20, 50, 100]
+
+def table_page(dataset, row_ids, page, page_size, sort_column, sort_order):
+    """Build the data table and record message for one page of a selection"""
+    page_size = int(page_size)
+    columns_by_label = {label: column for column, label in TABLE_COLUMNS.items()}
+    page_ids, page, pages = dataset.pager.page(
+        row_ids, page, page_size, columns_by_label.get(sort_column), sort_order == "descending"
     )
     
-    # Style the chart
-    ax.set_title('Distribution of Contaminant Level Types', fontsize=16)
-    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    # Only the rows on the page are materialized
+    table_df = dataset.take(page_ids, list(TABLE_COLUMNS)).rename(columns=TABLE_COLUMNS)
     
-    # Improve label readability
-    for text in texts:
-        text.set_fontsize(9)
-    
-    for autotext in autotexts:
-        autotext.set_fontsize(9)
-        autotext.set_weight('bold')
-    
-    fig.tight_layout()
-    return fig
-
-def create_heatmap(filtered_df):
-    """Create a heatmap of contaminants vs commodities using Matplotlib"""
-    if filtered_df.empty:
-        fig = Figure(figsize=(10, 6))
-        ax = fig.add_subplot(111)
-        ax.text(0.5, 0.5, "No data available for visualization", 
-                ha='center', va='center', fontsize=14)
-        ax.axis('off')
-        return fig
-    
-    top_contaminants = filtered_df['Contaminant'].value_counts().nlargest(10).index.tolist()
-    top_commodities = filtered_df['Commodity'].value_counts().nlargest(10).index.tolist()
-    
-    # Create a matrix for the heatmap
-    matrix = np.zeros((len(top_contaminants), len(top_commodities)))
-    
-    # Fill in the matrix
-    for i, contaminant in enumerate(top_contaminants):
-        for j, commodity in enumerate(top_commodities):
-            count = len(filtered_df[(filtered_df['Contaminant'] == contaminant) & 
-                                    (filtered_df['Commodity'] == commodity)])
-            matrix[i, j] = count
-    
-    fig = Figure(figsize=(12, 8))
-    ax = fig.add_subplot(111)
-    
-    # Create the heatmap
-    im = ax.imshow(matrix, cmap='viridis')
-    
-    # Add a color bar
-    cbar = fig.colorbar(im, ax=ax)
-    cbar.set_label('Count')
-    
-    # Set ticks and labels
-    ax.set_xticks(np.arange(len(top_commodities)))
-    ax.set_yticks(np.arange(len(top_contaminants)))
-    ax.set_xticklabels(top_commodities)
-    ax.set_yticklabels(top_contaminants)
-    
-    # Rotate the x-axis labels
-    plt.setp(ax.get_xticklabels(), rotation=45, ha="right",
-             rotation_mode="anchor")
+    if len(row_ids) > page_size:
+        first = (page - 1) * page_size + 1
+        records_message = (f"Showing records {first:,}–{first + len(page_ids) - 1:,} of {len(row_ids):,} "
+                           f"matching records (page {page:,} of {pages:,})")
+    else:
+        records_message = f"Showing all {len(row_ids)} matching records"
+    return table_df, records_message, page
+
+# Complete interface results keyed by (canonical filters, chart type and backend, table state, dataset version),
+# shared by every session so popular views such as the default one are built once
+result_cache = LRUCache(RESULT_CACHE_BYTES)
+
+# Dropdown updates keyed by (canonical filters, dataset version); kept apart from the results because
+# the counts also change when rows outside the selection are added
+facet_cache = LRUCache(FACET_CACHE_BYTES)
+
+# Charts and results stay valid across a reload that appends no rows to their selection, facets do not
+result_caches.extend([figure_cache, result_cache])
+dataset_caches.append(facet_cache)
+
+def result_size(result):
+    """Approximate memory held by an update_interface result without its facets"""
+    stats_html, fig, table_df, records_message, page = result
+    return len(stats_html) + fig.nbytes + int(table_df.memory_usage(deep=True).sum()) + len(records_message)
+
+def facets_size(facets):
+    return sum(len(str(choice)) for facet in facets for choice in facet['choices'])
+
+# Main interface update function
+# Key of a complete result in result_cache
+def result_key(dataset, filters, chart_type, chart_backend, page_size, sort_column, sort_order):
+    return (filters, (chart_type, chart_backend), (int(page_size), sort_column, sort_order), dataset.version)
+
+def update_interface(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, chart_type,
+                     page_size=PAGE_SIZES[0], sort_column="", sort_order="ascending", chart_backend=CHART_BACKEND,
+                     search_mode="exact", checkpoint=None):
+    """Update the interface based on filters and chart type"""
+    # Every stage of this request works on the same dataset, even if a reload swaps in a newer one
+    dataset = current_dataset()
+    filters = canonical_filters(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit,
+                                search_mode)
+    key = result_key(dataset, filters, chart_type, chart_backend, page_size, sort_column, sort_order)
+    trace = RequestTrace()
+    with profiler.capture('update_interface') if profiler else nullcontext():
+        result = result_cache.get(key)
+        facets = facet_cache.get((filters, dataset.version))
+        cached = result is not None and facets is not None
+        if result is None:
+            stats_html, fig, table_df, records_message, page, *facets = build_interface(
+                dataset, contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, chart_type,
+                page_size, sort_column, sort_order, chart_backend, search_mode, checkpoint, trace)
+            result = (stats_html, fig, table_df, records_message, page)
+            result_cache.put(key, result, result_size(result))
+            facet_cache.put((filters, dataset.version), tuple(facets), facets_size(facets))
+        elif facets is None:
+            # The result outlived an append; its facet counts have to follow the new rows
+            with trace.stage('facets'):
+                facets = facet_updates(dataset, contaminant, commodity, level_type, search_term, level_min, level_max,
+                                       level_unit, search_mode)
+            facet_cache.put((filters, dataset.version), facets, facets_size(facets))
+    request_metrics.record(trace, chart_type, filter_shape(filters), cached, {
+        'filters': filters, 'chart_type': chart_type, 'chart_backend': chart_backend, 'version': dataset.version,
+    })
+    return (*result, *facets)
+
+def build_interface(dataset, contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, chart_type,
+                    page_size=PAGE_SIZES[0], sort_column="", sort_order="ascending", chart_backend=CHART_BACKEND,
+                    search_mode="exact", checkpoint=None, trace=None):
+    """Compute the stats, chart, first table page and record message for a filter state.
     
-    # Loop over data dimensions and create text annotations
-    for i in range(len(top_contaminants)):
-        for j in range(len(top_commodities)):
-            text = ax.text(j, i, int(matrix[i, j]),
-                           ha="center", va="center", color="w" if matrix[i, j] > matrix.max() / 2 else "black")
+    ``checkpoint`` is called between stages and may raise to abandon the work.
+    Stage timings are added to ``trace`` when one is given.
+    """
+    trace = trace or RequestTrace()
     
-    # Style the chart
-    ax.set_title('Heatmap of Top Contaminants vs Top Commodities', fontsize=16)
-    fig.tight_layout()
-    return fig
-
-def create_stacked_bar(filtered_df):
-    """Create a stacked bar chart of level types by contaminant using Matplotlib"""
-    if filtered_df.empty:
-        fig = Figure(figsize=(10, 6))
-        ax = fig.add_subplot(111)
-        ax.text(0.5, 0.5, "No data available for visualization", 
-                ha='center', va='center', fontsize=14)
-        ax.axis('off')
-        return fig
+    # Filter the data
+    with trace.stage('select') as stage:
+        row_ids = matching_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, dataset,
+                                search_mode)
+        stage['rows'] = len(row_ids)
     
-    top_contaminants = filtered_df['Contaminant'].value_counts().nlargest(10).index.tolist()
-    level_types = filtered_df['Contaminant Level Type'].unique().tolist()
+    # Calculate stats
+    with trace.stage('stats', len(row_ids)):
+        stats_html = calculate_stats(dataset, row_ids)
     
-    # Prepare data
-    data = {}
-    for level_type in level_types:
-        data[level_type] = []
-        for contaminant in top_contaminants:
-            count = len(filtered_df[(filtered_df['Contaminant'] == contaminant) & 
-                                   (filtered_df['Contaminant Level Type'] == level_type)])
-            data[level_type].append(count)
+    # Recount the dropdown options under the other active filters
+    with trace.stage('facets'):
+        facets = facet_updates(dataset, contaminant, commodity, level_type, search_term, level_min, level_max, level_unit,
+                               search_mode)
     
-    fig = Figure(figsize=(12, 8))
-    ax = fig.add_subplot(111)
+    # Charting is the most expensive stage, so skip it if the request went stale
+    if checkpoint:
+        checkpoint()
     
-    # Create the stacked bar chart
-    bottoms = np.zeros(len(top_contaminants))
-    for level_type in level_types:
-        ax.bar(top_contaminants, data[level_type], bottom=bottoms, label=level_type)
-        bottoms += np.array(data[level_type])
+    # Create visualization, reusing the rendered chart when the filters are unchanged
+    filters = canonical_filters(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit,
+                                search_mode)
+    fig = cached_visualization(dataset, filters, chart_type, row_ids, chart_backend, trace)
     
-    # Style the chart
-    ax.set_title('Contaminant Level Types by Top 10 Contaminants', fontsize=16)
-    ax.set_xlabel('Contaminant')
-    ax.set_ylabel('Count')
-    ax.legend(title='Level Type')
-    ax.tick_params(axis='x', rotation=45)
+    # Prepare the first page of the data table
+    with trace.stage('table', len(row_ids)):
+        table_df, records_message, page = table_page(dataset, row_ids, 1, page_size, sort_column, sort_order)
     
-    fig.tight_layout()
-    return fig
-
-def create_empty_figure(message="No data available for visualization"):
-    """Create an empty figure with a message"""
-    fig = Figure(figsize=(10, 6))
-    ax = fig.add_subplot(111)
-    ax.text(0.5, 0.5, message, ha='center', va='center', fontsize=14)
-    ax.axis('off')
-    return fig
-
-# Main visualization function
-def create_visualization(filtered_df, chart_type):
-    """Create a visualization based on the selected chart type"""
-    try:
-        # Handle empty data
-        if filtered_df.empty:
-            return create_empty_figure()
-            
-        # Create the appropriate visualization based on the chart type
-        if chart_type == "contaminant_distribution":
-            return create_contaminant_bar(filtered_df)
-        elif chart_type == "commodity_distribution":
-            return create_commodity_bar(filtered_df)
-        elif chart_type == "level_type_distribution":
-            return create_level_type_pie(filtered_df)
-        elif chart_type == "heatmap":
-            return create_heatmap(filtered_df)
-        elif chart_type == "level_type_by_contaminant":
-            return create_stacked_bar(filtered_df)
+    return (stats_html, fig, table_df, records_message, page, *facets)
+
+# Latest-wins gate so only the newest filter state of each session gets rendered
+coalescer = RequestCoalescer(delay=COALESCE_DELAY_MS / 1000)
+
+# Request latency histograms and counters, served at /metrics
+metrics = Metrics('food_contaminants_')
+request_metrics = RequestMetrics(metrics, SLOW_REQUEST_MS / 1000)
+
+# Profiles the next requests once armed through /debug/profile
+profiler = RequestProfiler(PROFILE_DIR) if PROFILE_DIR else None
+
+def collect_metrics():
+    """Cache, coalescer, render pool and dataset figures for /metrics"""
+    samples = []
+    for name, cache in [('selection', selection_cache), ('figure', figure_cache), ('result', result_cache),
+                        ('facet', facet_cache)]:
+        stats = cache.stats()
+        labels = {'cache': name}
+        samples += [
+            ('cache_hits_total', 'counter', "Cache lookups that found an entry", labels, stats['hits']),
+            ('cache_misses_total', 'counter', "Cache lookups that found no entry", labels, stats['misses']),
+            ('cache_evictions_total', 'counter', "Cache entries evicted or dropped on reload", labels, stats['evictions']),
+            ('cache_entries', 'gauge', "Entries held by each cache", labels, stats['entries']),
+            ('cache_bytes', 'gauge', "Approximate memory held by each cache", labels, stats['bytes']),
+        ]
+    for name, value in coalescer.stats().items():
+        if name == 'sessions':
+            samples.append(('coalescer_sessions', 'gauge', "Sessions with a recent filter change", {}, value))
         else:
-            # Default to contaminant bar if unknown chart type
-            return create_contaminant_bar(filtered_df)
-        
-    except Exception as e:
-        print(f"Error creating visualization: {str(e)}")
-        return create_empty_figure(f"Error creating visualization: {str(e)}")
+            samples.append(('coalescer_jobs_total', 'counter', "Filter change jobs by outcome", {'state': name}, value))
+    if render_pool:
+        for name, value in render_pool.stats().items():
+            if name in ('workers', 'pending'):
+                samples.append((f'render_pool_{name}', 'gauge', f"Render pool {name}", {}, value))
+            else:
+                samples.append(('render_pool_renders_total', 'counter', "Render pool renders by outcome",
+                                {'outcome': name}, value))
+    dataset = current_dataset()
+    samples.append(('dataset_rows', 'gauge', "Rows in the served dataset", {'version': dataset.version}, len(dataset.store)))
+    return samples
 
-# Main interface update function
-def update_interface(contaminant, commodity, level_type, search_term, level_min, level_max, chart_type):
-    """Update the interface based on filters and chart type"""
-    # Filter the data
-    filtered_df = filter_data(contaminant, commodity, level_type, search_term, level_min, level_max)
-    
-    # Calculate stats
-    stats_html = calculate_stats(filtered_df)
-    
-    # Create visualization
-    fig = create_visualization(filtered_df, chart_type)
-    
-    # Prepare the table data
-    if filtered_df.empty:
-        table_df = pd.DataFrame({
-            "Contaminant": [],
-            "Commodity": [],
-            "Level Type": [],
-            "Level": [],
-            "Reference": [],
-            "Link": []
-        })
-    else:
-        # Create a clean DataFrame for display
-        table_df = filtered_df.copy()
-        table_df = table_df.rename(columns={
-            'Contaminant Level Type': 'Level Type',
-            'Link to Reference': 'Link'
-        })
-        
-        # Limit to relevant columns and first 1000 rows to avoid performance issues
-        table_df = table_df[['Contaminant', 'Commodity', 'Level Type', 'Level', 'Reference', 'Link']]
-        if len(table_df) > 1000:
-            table_df = table_df.head(1000)
-    
-    # Add warning message if results were limited
-    if len(filtered_df) > 1000:
-        records_message = f"⚠️ Showing top 1,000 records of {len(filtered_df)} total matching records"
-    else:
-        records_message = f"Showing all {len(filtered_df)} matching records"
+metrics.add_collector(collect_metrics)
+
+def update_interface_latest(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, chart_type,
+                            page_size, sort_column, sort_order, chart_backend, search_mode, request: gr.Request):
+    """Run update_interface for the newest event of a session, dropping superseded ones"""
+    # Events without a session are not coalesced, rather than all sharing one
+    job = coalescer.begin(getattr(request, "session_hash", None))
+    filters = canonical_filters(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit,
+                                search_mode)
+    cached = result_key(current_dataset(), filters, chart_type, chart_backend, page_size, sort_column,
+                        sort_order) in result_cache
+    try:
+        # Only work that has to be computed waits to see whether a newer event supersedes it
+        if not cached and not coalescer.settle(job):
+            raise Superseded()
+        result = update_interface(
+            contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, chart_type,
+            page_size, sort_column, sort_order, chart_backend, search_mode, checkpoint=lambda: coalescer.check(job)
+        )
+    except Superseded:
+        coalescer.finish(job, dropped=True)
+        request_metrics.dropped()
+        # Leave the outputs as they are; the newer job will fill them in
+        return tuple(gr.update() for _ in range(5 + len(FILTER_COLUMNS)))
+    coalescer.finish(job)
+    return result
+
+def update_table(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit,
+                 page, page_size, sort_column, sort_order, search_mode="exact"):
+    """Serve one page of the current selection to the data table"""
+    dataset = current_dataset()
+    row_ids = matching_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, dataset,
+                            search_mode)
+    return table_page(dataset, row_ids, page or 1, page_size, sort_column, sort_order)
+
+def export_link(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, export_format,
+                search_mode="exact"):
+    """Download link for every row matching the filters, streamed by the /api/export endpoint"""
+    dataset = current_dataset()
+    row_ids = matching_rows(contaminant, commodity, level_type, search_term, level_min, level_max, level_unit, dataset,
+                            search_mode)
+    
+    params = [('format', export_format)]
+    for name, option in [('contaminant', contaminant), ('commodity', commodity), ('level_type', level_type)]:
+        if option:
+            params += [(name, value) for value in selected_values(option) if value is not None]
+    if search_term:
+        params.append(('search', search_term))
+        if search_mode != "exact":
+            params.append(('search_mode', search_mode))
+    if level_min is not None:
+        params.append(('level_min', level_min))
+    if level_max is not None:
+        params.append(('level_max', level_max))
+    if level_min is not None or level_max is not None:
+        params.append(('level_unit', level_unit))
     
-    return stats_html, fig, table_df, records_message
+    url = html.escape(f"api/export?{urlencode(params)}")
+    return f'<a href="{url}" download>Download {len(row_ids):,} records as {export_format.upper()}</a>'
 
-def clear_filters():
+def clear_filters(chart_backend=CHART_BACKEND):
     """Reset all filters to their default values"""
-    empty_filter_result = update_interface([], [], [], "", None, None, "contaminant_distribution")
-    return [], [], [], "", None, None, "contaminant_distribution", empty_filter_result
+    *empty_filter_result, contaminant_choices, commodity_choices, level_type_choices = update_interface(
+        [], [], [], "", None, None, "ppm", "contaminant_distribution", chart_backend=chart_backend)
+    # The dropdowns are emptied and get their unfiltered counts in the same update
+    return (dict(contaminant_choices, value=[]), dict(commodity_choices, value=[]), dict(level_type_choices, value=[]),
+            "", None, None, "ppm", "contaminant_distribution", PAGE_SIZES[0], "", "ascending",
+            chart_backend, "exact", *empty_filter_result)
 
-# Build the Gradio interface
-with gr.Blocks(css=custom_css, title=page_title) as demo:
-    gr.HTML(f"""
+def header_html(dataset):
+    """Page header showing when the served dataset was last updated"""
+    return f"""
     <div class="app-header">
         <h1>{page_title}</h1>
         <p>This interactive tool allows you to explore FDA contaminant levels in various food commodities. 
         Use the filters below to narrow down the data and switch between different visualization types.</p>
-        <p><small>Dataset last updated: {last_modified_date}</small></p>
+        <p><small>Dataset last updated: {dataset.last_modified_date}</small></p>
     </div>
-    """)
+    """
+
+def load_interface():
+    """Initial view for a new page: default results and filter choices plus the header of the current dataset"""
+    return (*update_interface([], [], [], "", None, None, "ppm", "contaminant_distribution"),
+            header_html(current_dataset()))
+
+# Build the Gradio interface
+with gr.Blocks(css=custom_css, title=page_title) as demo:
+    header = gr.HTML(header_html(current_dataset()))
     
     with gr.Row():
         # Left column - filters
@@ -576,11 +499,23 @@ with gr.Blocks(css=custom_css, title=page_title) as demo:
                     placeholder="Enter search terms...",
                     elem_id="search-input"
                 )
+                search_mode = gr.Radio(
+                    choices=[("Exact text", "exact"), ("Best matches, typos allowed", "ranked")],
+                    label="Search Mode",
+                    value="exact"
+                )
                 
                 with gr.Row():
                     level_min = gr.Number(label="Min Level Value", value=None)
                     level_max = gr.Number(label="Max Level Value", value=None)
                 
+                level_unit = gr.Dropdown(
+                    choices=[(label, unit) for unit, label in UNIT_FAMILIES.items()],
+                    label="Level Unit",
+                    value="ppm",
+                    elem_id="level-unit-filter"
+                )
+                
                 clear_btn = gr.Button("Clear All Filters")
             
             stats_html = gr.HTML(elem_classes=["data-card"])
@@ -623,28 +558,60 @@ with gr.Blocks(css=custom_css, title=page_title) as demo:
                   </ul>
                 </div>
                 """)
+                chart_backend = gr.Radio(
+                    choices=[("Interactive (drawn in the browser)", "plotly"),
+                             ("Static image (rendered on the server)", "matplotlib")],
+                    label="Chart Rendering",
+                    value=CHART_BACKEND
+                )
                 redraw_btn = gr.Button("Redraw Visualization")
             
-            # Use Plot component to display matplotlib figure
+            # Plot component shows plotly charts drawn by the browser or prerendered matplotlib images
             visualization = gr.Plot(elem_classes=["chart-container"], label="Visualization")
             
             records_message = gr.Markdown(elem_classes=["records-message"])
             
             with gr.Group(elem_classes=["data-card"]):
                 gr.Markdown("### Data Table")
+                
+                with gr.Row():
+                    sort_column = gr.Dropdown(
+                        choices=[""] + list(TABLE_COLUMNS.values()),
+                        label="Sort By",
+                        value=""
+                    )
+                    sort_order = gr.Radio(
+                        choices=["ascending", "descending"],
+                        label="Order",
+                        value="ascending"
+                    )
+                    page_size = gr.Dropdown(
+                        choices=PAGE_SIZES,
+                        label="Rows per Page",
+                        value=PAGE_SIZES[0]
+                    )
+                
                 data_table = gr.DataFrame(
-                    headers=[
-                        "Contaminant",
-                        "Commodity",
-                        "Level Type",
-                        "Level",
-                        "Reference",
-                        "Link"
-                    ],
+                    headers=list(TABLE_COLUMNS.values()),
                     wrap=True,
                     elem_id="data-table",
-                    max_rows=20
+                    max_rows=max(PAGE_SIZES)
                 )
+                
+                with gr.Row():
+                    prev_btn = gr.Button("◀ Previous")
+                    page_number = gr.Number(label="Page", value=1, precision=0)
+                    next_btn = gr.Button("Next ▶")
+                
+                # Exports cover the whole selection, not just the page shown
+                with gr.Row():
+                    export_format = gr.Radio(
+                        choices=export_formats(),
+                        label="Export Format",
+                        value="csv"
+                    )
+                    export_btn = gr.Button("Export All Matching Records")
+                export_download = gr.HTML()
     
     gr.HTML("""
     <div class="footer">
@@ -662,7 +629,13 @@ with gr.Blocks(css=custom_css, title=page_title) as demo:
         search_input, 
         level_min, 
         level_max,
-        chart_type
+        level_unit,
+        chart_type,
+        page_size,
+        sort_column,
+        sort_order,
+        chart_backend,
+        search_mode
     ]
     
     # All outputs from update_interface
@@ -670,45 +643,99 @@ with gr.Blocks(css=custom_css, title=page_title) as demo:
         stats_html,
         visualization, 
         data_table,
-        records_message
+        records_message,
+        page_number
     ]
     
+    # Dropdowns whose option counts follow the other filters
+    facet_outputs = [contaminant_dropdown, commodity_dropdown, level_type_dropdown]
+    
+    # Inputs and outputs for paging through the data table
+    filter_inputs = all_inputs[:7]
+    table_inputs = filter_inputs + [page_number, page_size, sort_column, sort_order, search_mode]
+    table_outputs = [data_table, records_message, page_number]
+    
     # Set up the events
     
-    # When filter inputs change
-    for component in [contaminant_dropdown, commodity_dropdown, level_type_dropdown, search_input, level_min, level_max]:
+    # When filter inputs change; typing or clicking through options coalesces into one update
+    for component in [contaminant_dropdown, commodity_dropdown, level_type_dropdown, search_input, search_mode, level_min, level_max,
+                      level_unit]:
         component.change(
-            update_interface,
+            update_interface_latest,
             inputs=all_inputs,
-            outputs=all_outputs
+            outputs=all_outputs + facet_outputs
         )
     
     # Special handler just for chart type
     chart_type.change(
-        update_interface,  # Use the full update interface function instead
+        update_interface_latest,  # Use the full update interface function instead
+        inputs=all_inputs,
+        outputs=all_outputs + facet_outputs
+    )
+    chart_backend.change(
+        update_interface_latest,
         inputs=all_inputs,
-        outputs=all_outputs
+        outputs=all_outputs + facet_outputs
     )
     
     # Add a redraw button for visualizations
     redraw_btn.click(
-        update_interface,
+        update_interface_latest,
         inputs=all_inputs,
-        outputs=all_outputs
+        outputs=all_outputs + facet_outputs
+    )
+    
+    # Paging and sorting only fetch a new page of the current selection
+    page_number.submit(
+        update_table,
+        inputs=table_inputs,
+        outputs=table_outputs
+    )
+    prev_btn.click(
+        lambda *args: update_table(*args[:7], (args[7] or 1) - 1, *args[8:]),
+        inputs=table_inputs,
+        outputs=table_outputs
+    )
+    next_btn.click(
+        lambda *args: update_table(*args[:7], (args[7] or 1) + 1, *args[8:]),
+        inputs=table_inputs,
+        outputs=table_outputs
+    )
+    for component in [page_size, sort_column, sort_order]:
+        component.change(
+            lambda *args: update_table(*args[:7], 1, *args[8:]),
+            inputs=table_inputs,
+            outputs=table_outputs
+        )
+    
+    # Export button links to a streamed download of the current selection
+    export_btn.click(
+        export_link,
+        inputs=filter_inputs + [export_format, search_mode],
+        outputs=export_download
     )
     
     # Clear button handler
     clear_btn.click(
         clear_filters,
+        inputs=chart_backend,
         outputs=all_inputs + all_outputs
     )
     
     # Initialize the interface with default values
     demo.load(
-        lambda: update_interface([], [], [], "", None, None, "contaminant_distribution"),
-        outputs=all_outputs
+        load_interface,
+        outputs=all_outputs + facet_outputs + [header]
     )
 
-# Launch the app
+if render_pool:
+    render_pool.start()
+
+# Launch the app, with the JSON query API under /api
 if __name__ == "__main__":
-    demo.launch(share=False)
\ No newline at end of file
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    app = FastAPI()
+    add_metrics_routes(app, metrics, profiler)
+    app.mount("/api", create_api(current_dataset))
+    app = gr.mount_gradio_app(app, demo.queue(concurrency_count=QUEUE_CONCURRENCY), path="/")
+    uvicorn.run(app, host=SERVER_NAME, port=SERVER_PORT)
\ No newline at end of file
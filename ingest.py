@@ -0,0 +1,121 @@
+"""Append new rows to the dataset without reloading it.
+
+New action and tolerance levels arrive a few rows at a time. Instead of
+parsing the whole CSV again, ``append_rows`` checks and cleans just the new
+rows, appends them to the CSV and extends the dataset's dictionaries,
+posting lists, option counts and search index with them. A running app
+picks them up the same way: its reloader extends the served dataset when
+the CSV only grew, and keeps the cached results the new rows do not change.
+
+    python ingest.py new-rows.csv [more-rows.csv ...]
+"""
+import argparse
+import csv
+import io
+import os
+
+import pandas as pd
+
+from csv_source import normalize_columns
+from dataset import DATA_PATH, KEY_COLUMNS, Dataset, read_csv_data
+from level_parser import add_level_columns
+from snapshot import SNAPSHOT_DIR, snapshot_lock
+
+# Columns every new row has to fill in
+REQUIRED_COLUMNS = ['Contaminant', 'Commodity', 'Contaminant Level Type', 'Level', 'Reference']
+
+
+def clean_rows(dataset, rows):
+    """New rows as the dataset holds them: the CSV's columns with their text normalized, plus the parsed Level"""
+    missing = [column for column in dataset.source_columns if column not in rows.columns]
+    unexpected = [column for column in rows.columns if column not in dataset.columns]
+    if missing or unexpected:
+        raise ValueError(f"New rows must have the columns {dataset.source_columns}; "
+                         f"missing {missing}, unexpected {unexpected}")
+    # Any parsed level columns passed in are parsed again from Level
+    rows = normalize_columns(rows[dataset.source_columns].astype(object))
+    return add_level_columns(rows)[dataset.columns]
+
+
+def check_rows(dataset, rows):
+    """Clean new rows and split them into (rows to append, rejected rows with a Problem column)"""
+    rows = clean_rows(dataset, rows)
+
+    problems = pd.Series('', index=rows.index, dtype=object)
+    def flag(mask, problem):
+        problems[mask & (problems == '')] = problem
+
+    for column in REQUIRED_COLUMNS:
+        flag(rows[column].isna() | (rows[column] == ''), f"missing {column}")
+    flag(rows['Level Unit'].isna(), "Level is not a number with a known unit")
+    flag(dataset.duplicate_keys(rows), f"duplicate {'/'.join(KEY_COLUMNS)}")
+
+    rejected = problems != ''
+    return rows[~rejected], rows[rejected].assign(Problem=problems[rejected])
+
+
+def write_csv_rows(path, rows):
+    """Append rows to a CSV file, quoted and line-terminated like the rows already in it"""
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - 2))
+        end = f.read()
+    line_end = '\r\n' if end.endswith(b'\r\n') or not end else '\n'
+
+    buffer = io.StringIO()
+    if end and not end.endswith(b'\n'):
+        buffer.write(line_end)
+    rows.to_csv(buffer, header=False, index=False, quoting=csv.QUOTE_ALL, lineterminator=line_end)
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write(buffer.getvalue())
+
+
+def append_rows(rows, path=DATA_PATH, snapshot_dir=SNAPSHOT_DIR, dataset=None, skip_rejected=False):
+    """Append new rows to the CSV; return (extended dataset, rejected rows).
+
+    ``rows`` has the CSV's columns and is cleaned like the CSV is. Raises
+    ValueError if any row is rejected, unless ``skip_rejected`` appends
+    the others. The extended dataset is published as the snapshot of the
+    new version and served from it, so nothing is parsed but the new rows.
+    """
+    dataset = dataset or Dataset.load(path, snapshot_dir)
+    accepted, rejected = check_rows(dataset, rows)
+    if len(rejected) and not skip_rejected:
+        problems = "; ".join(f"row {i}: {problem}" for i, problem in rejected['Problem'].head(5).items())
+        raise ValueError(f"{len(rejected)} of {len(rows)} new rows rejected ({problems})")
+
+    # Writing under the snapshot lock keeps app processes from snapshotting the CSV half-way
+    with snapshot_lock(snapshot_dir):
+        write_csv_rows(path, accepted[dataset.source_columns])
+    extended = dataset.extend(path, snapshot_dir)
+    if extended is None:
+        # The CSV was also changed some other way since the dataset was loaded
+        extended = Dataset.load(path, snapshot_dir)
+    return extended, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append new rows to the contaminant dataset")
+    parser.add_argument('rows', nargs='+', help="CSVs of new rows, with the same header as the dataset")
+    parser.add_argument('--csv', default=DATA_PATH, help="dataset CSV to append to (default: %(default)s)")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR, help="snapshot directory (default: %(default)s)")
+    parser.add_argument('--skip-rejected', action='store_true',
+                        help="append the valid rows even if others are rejected")
+    parser.add_argument('--dry-run', action='store_true', help="check the rows without appending them")
+    args = parser.parse_args()
+
+    dataset = Dataset.load(args.csv, args.snapshot_dir)
+    rows = read_csv_data(args.rows)
+    accepted, rejected = check_rows(dataset, rows)
+    for i, row in rejected.iterrows():
+        print(f"row {i + 1}: {row['Problem']}: {row['Contaminant']} / {row['Commodity']} / {row['Reference']}")
+    if args.dry_run or (len(rejected) and not args.skip_rejected):
+        print(f"{len(accepted)} rows can be appended, {len(rejected)} rejected; nothing written")
+        return 1 if len(rejected) else 0
+
+    extended, _ = append_rows(rows, args.csv, args.snapshot_dir, dataset, skip_rejected=True)
+    print(f"Appended {len(accepted)} rows to {args.csv} ({len(extended.store)} rows, version {extended.version})")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
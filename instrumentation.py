@@ -0,0 +1,263 @@
+"""Request stage timings, Prometheus metrics and on-demand profiling.
+
+Every UI request carries a RequestTrace that times its stages (row
+selection, stats, facet counts, chart spec and render, table page) and
+notes how many rows each one worked on. Finished traces feed latency
+histograms labelled by chart type and filter shape, that is which kinds of
+filter were active, and requests slower than a threshold are logged with
+their inputs and stage breakdown. ``Metrics.render`` produces the
+Prometheus text format, so the histograms, together with gauges such as
+cache hit counts, can be scraped from /metrics.
+
+A RequestProfiler, once armed, profiles the next request with pyinstrument
+when it is installed and with cProfile otherwise, and writes the profile
+to a directory.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from fastapi import Query
+from fastapi.responses import Response
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Names of the filter kinds in a filter shape, in canonical_filters order
+FILTER_KINDS = ['contaminant', 'commodity', 'level_type', 'search', 'level']
+
+
+def filter_shape(filters):
+    """Which kinds of filter a canonical filter tuple uses, e.g. "contaminant+search", or "none" """
+    return '+'.join(kind for kind, value in zip(FILTER_KINDS, filters) if value) or 'none'
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms keyed by name and labels, rendered in the Prometheus text format.
+
+    Values kept elsewhere, such as cache counters, are read when the
+    metrics are rendered from collectors: callbacks returning
+    (name, type, help, labels, value) tuples.
+    """
+
+    def __init__(self, prefix, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.descriptions = {}
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self.descriptions[name] = help_text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_collector(self, collector):
+        """Register a callback returning (name, type, help, labels, value) tuples, read on every render"""
+        self.collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            histograms = [(key, list(h.counts), h.sum, h.count) for key, h in sorted(self.histograms.items())]
+            counters = sorted(self.counters.items())
+        # Samples of one metric have to be adjacent
+        collected = sorted((sample for collector in self.collectors for sample in collector()), key=lambda sample: sample[0])
+
+        lines = []
+        described = set()
+        def header(name, kind, help_text=None):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {self.prefix}{name} {help_text or self.descriptions.get(name, name)}")
+                lines.append(f"# TYPE {self.prefix}{name} {kind}")
+
+        for (name, labels), counts, total, count in histograms:
+            header(name, 'histogram')
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.prefix}{name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {bucket_count}")
+            lines.append(f"{self.prefix}{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.prefix}{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{self.prefix}{name}_count{format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{self.prefix}{name}{format_labels(labels)} {value}")
+        for name, kind, help_text, labels, value in collected:
+            header(name, kind, help_text)
+            lines.append(f"{self.prefix}{name}{format_labels(tuple(sorted(labels.items())))} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class RequestTrace:
+    """Durations and row counts of the stages of one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time a stage; the yielded dict takes the stage's row count as 'rows' if not given here"""
+        record = {'stage': name, 'rows': rows}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.stages.append(record)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        """The stages as "select 12.3 ms (4,500 rows), stats 3.1 ms, ..." """
+        return ", ".join(
+            f"{record['stage']} {record['seconds'] * 1000:.1f} ms"
+            + (f" ({record['rows']:,} rows)" if record['rows'] is not None else "")
+            for record in self.stages
+        )
+
+
+class RequestMetrics:
+    """Records finished request traces into a Metrics registry and logs the slow ones"""
+
+    def __init__(self, metrics, slow_seconds):
+        self.metrics = metrics
+        self.slow_seconds = slow_seconds
+        metrics.describe('request_seconds', "Duration of UI requests by chart type, filter shape and result cache outcome")
+        metrics.describe('request_stage_seconds', "Duration of each stage of the UI requests that were not cached")
+        metrics.describe('requests_total', "UI requests by outcome")
+
+    def record(self, trace, chart_type, shape, cached, inputs):
+        seconds = trace.elapsed()
+        self.metrics.observe('request_seconds', seconds, chart_type=chart_type, filter_shape=shape,
+                             cache='hit' if cached else 'miss')
+        for record in trace.stages:
+            self.metrics.observe('request_stage_seconds', record['seconds'], stage=record['stage'],
+                                 chart_type=chart_type, filter_shape=shape)
+        self.metrics.inc('requests_total', outcome='completed')
+        if seconds >= self.slow_seconds:
+            logger.warning("Slow request: %.0f ms for %s (%s)", seconds * 1000, inputs,
+                           trace.summary() or "result cache hit")
+
+    def dropped(self):
+        self.metrics.inc('requests_total', outcome='superseded')
+
+
+class RequestProfiler:
+    """Profiles the next requests once armed, writing one profile file per request to ``out_dir``"""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.armed = 0
+        self.captured = []
+        self.lock = threading.Lock()
+
+    def arm(self, count=1):
+        with self.lock:
+            self.armed += count
+            return self.armed
+
+    def _take(self):
+        with self.lock:
+            if self.armed <= 0:
+                return False
+            self.armed -= 1
+            return True
+
+    @contextmanager
+    def capture(self, name):
+        """Profile the block if the profiler is armed, else just run it"""
+        if not self._take():
+            yield
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+        top = io.StringIO()
+        if Profiler is not None:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path += '.html'
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                path += '.prof'
+                profiler.dump_stats(path)
+                pstats.Stats(profiler, stream=top).sort_stats('cumulative').print_stats(15)
+        with self.lock:
+            self.captured.append(path)
+        logger.info("Profile of %s written to %s\n%s", name, path, top.getvalue())
+
+
+def add_metrics_routes(app, metrics, profiler=None):
+    """Serve the metrics at /metrics and, with a profiler, arm it with POST /debug/profile?count=N"""
+    @app.get('/metrics', include_in_schema=False)
+    def metrics_endpoint():
+        return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    if profiler is not None:
+        @app.post('/debug/profile', include_in_schema=False)
+        def arm_profiler(count: int = Query(1, ge=1, le=100)):
+            return {'armed': profiler.arm(count), 'out_dir': profiler.out_dir, 'captured': profiler.captured[-10:]}
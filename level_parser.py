@@ -0,0 +1,100 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Unit families levels are normalized into, with the canonical unit of each
+UNIT_FAMILIES = {
+    'ppm': 'Mass fraction (ppm)',
+    'Bq/kg': 'Activity (Bq/kg)',
+    'µg/mL': 'Leaching solution (µg/mL)',
+    '%': 'Percent (%)',
+}
+
+# Unit spelling -> (unit family, factor to the family's canonical unit)
+UNITS = {
+    'ppm': ('ppm', 1.0),
+    'mg/kg': ('ppm', 1.0),
+    'µg/g': ('ppm', 1.0),
+    'ppb': ('ppm', 1e-3),
+    'µg/kg': ('ppm', 1e-3),
+    'ng/g': ('ppm', 1e-3),
+    'ppt': ('ppm', 1e-6),
+    'ng/kg': ('ppm', 1e-6),
+    'bq/kg': ('Bq/kg', 1.0),
+    'µg/ml': ('µg/mL', 1.0),
+    'mg/l': ('µg/mL', 1.0),
+    '%': ('%', 1.0),
+}
+
+# Columns added to the table by add_level_columns
+LEVEL_COLUMNS = ['Level Value', 'Level Unit', 'Level Qualifier', 'Level Comparator']
+
+LEVEL_PATTERN = re.compile(
+    r'^(?P<comparator><=|>=|<|>|≤|≥)?\s*'
+    r'(?P<value>\d+(?:\.\d*)?|\.\d+)\s*'
+    r'(?P<unit>' + '|'.join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True)) + r')'
+    r'(?P<rest>.*)$',
+    re.IGNORECASE,
+)
+
+# "µg/" spelled with a replacement character, a Greek mu or a plain "u"
+MICRO_PATTERN = re.compile(r'(?<![A-Za-z])[�μu]g/')
+
+
+def normalize_level_text(level):
+    """Repair the mangled micro signs and non-breaking spaces found in the FDA export"""
+    text = MICRO_PATTERN.sub('µg/', level)
+    text = text.replace('�', ' ').replace('\xa0', ' ')
+    return ' '.join(text.split())
+
+
+def parse_level(level):
+    """Parse a Level string into (value, unit family, qualifier, comparator).
+
+    The value is converted to the family's canonical unit, so "20 ppb" becomes
+    0.02 in the "ppm" family. Anything after the unit, such as "(fat basis)"
+    or "in edible portion", is kept as the qualifier. Strings that do not
+    start with a number and a known unit parse to NaN with no unit family.
+    """
+    if not isinstance(level, str):
+        return np.nan, None, None, None
+    text = normalize_level_text(level)
+    match = LEVEL_PATTERN.match(text)
+    if not match:
+        return np.nan, None, text or None, None
+
+    family, factor = UNITS[match.group('unit').lower()]
+    value = float(match.group('value')) * factor
+    qualifier = match.group('rest').strip().strip('()').strip() or None
+    comparator = {'≤': '<=', '≥': '>='}.get(match.group('comparator'), match.group('comparator'))
+    return value, family, qualifier, comparator
+
+
+def add_level_columns(df):
+    """Add the typed Level Value/Unit/Qualifier/Comparator columns to the table.
+
+    Each distinct Level string is parsed once and the results are mapped back
+    onto the rows, so the cost follows the number of distinct levels.
+    """
+    codes, levels = pd.factorize(df['Level'])
+    # Missing levels have code -1, which picks the trailing empty row
+    parsed = pd.DataFrame(
+        [parse_level(level) for level in levels] + [(np.nan, None, None, None)],
+        columns=LEVEL_COLUMNS,
+    ).take(codes)
+
+    for column in LEVEL_COLUMNS:
+        # Missing text is NaN, like empty cells read from the CSV
+        df[column] = parsed[column].where(parsed[column].notna(), np.nan).to_numpy()
+    return df
+
+
+def level_range_mask(values, units, unit, level_min=None, level_max=None):
+    """Vectorized range check on canonical level values within one unit family"""
+    mask = units == unit
+    if level_min is not None:
+        mask &= values >= level_min
+    if level_max is not None:
+        mask &= values <= level_max
+    return mask
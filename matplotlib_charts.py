@@ -0,0 +1,161 @@
+"""Matplotlib backend: render chart specs to PNG images on the server.
+
+Kept apart from charts.py so that importing matplotlib is only paid for
+once a chart is actually rendered with this backend.
+"""
+import io
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+
+def draw_message(spec):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    ax.text(0.5, 0.5, spec['message'], ha='center', va='center', fontsize=14)
+    ax.axis('off')
+    return fig
+
+
+def draw_bar(spec):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+
+    # Create the bar chart
+    bars = ax.bar(spec['labels'], spec['values'], color=spec['color'])
+
+    # Style the chart
+    ax.set_title(spec['title'], fontsize=16)
+    ax.set_xlabel(spec['x_label'])
+    ax.set_ylabel(spec['y_label'])
+    ax.tick_params(axis='x', rotation=45)
+
+    # Add labels to the bars
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                f'{int(height)}', ha='center', va='bottom')
+
+    fig.tight_layout()
+    return fig
+
+
+def draw_pie(spec):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+
+    # Create the pie chart
+    wedges, texts, autotexts = ax.pie(
+        spec['values'],
+        labels=spec['labels'],
+        autopct='%1.1f%%',
+        startangle=90,
+        shadow=False
+    )
+
+    # Style the chart
+    ax.set_title(spec['title'], fontsize=16)
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+
+    # Improve label readability
+    for text in texts:
+        text.set_fontsize(9)
+
+    for autotext in autotexts:
+        autotext.set_fontsize(9)
+        autotext.set_weight('bold')
+
+    fig.tight_layout()
+    return fig
+
+
+def draw_heatmap(spec):
+    matrix = np.array(spec['matrix'])
+    x_labels, y_labels = spec['x_labels'], spec['y_labels']
+
+    fig = Figure(figsize=(12, 8))
+    ax = fig.add_subplot(111)
+
+    # Create the heatmap
+    im = ax.imshow(matrix, cmap='viridis')
+
+    # Add a color bar
+    cbar = fig.colorbar(im, ax=ax)
+    cbar.set_label('Count')
+
+    # Set ticks and labels
+    ax.set_xticks(np.arange(len(x_labels)))
+    ax.set_yticks(np.arange(len(y_labels)))
+    ax.set_xticklabels(x_labels)
+    ax.set_yticklabels(y_labels)
+
+    # Rotate the x-axis labels
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right",
+             rotation_mode="anchor")
+
+    # Loop over data dimensions and create text annotations (unreadable on large grids)
+    if spec['annotate']:
+        for i in range(len(y_labels)):
+            for j in range(len(x_labels)):
+                ax.text(j, i, int(matrix[i, j]),
+                        ha="center", va="center", color="w" if matrix[i, j] > matrix.max() / 2 else "black")
+
+    # Style the chart
+    ax.set_title(spec['title'], fontsize=16)
+    fig.tight_layout()
+    return fig
+
+
+def draw_stacked_bar(spec):
+    fig = Figure(figsize=(12, 8))
+    ax = fig.add_subplot(111)
+
+    # Create the stacked bar chart
+    bottoms = np.zeros(len(spec['labels']))
+    for series in spec['series']:
+        ax.bar(spec['labels'], series['values'], bottom=bottoms, label=series['name'])
+        bottoms += np.array(series['values'])
+
+    # Style the chart
+    ax.set_title(spec['title'], fontsize=16)
+    ax.set_xlabel(spec['x_label'])
+    ax.set_ylabel(spec['y_label'])
+    ax.legend(title=spec['legend_title'])
+    ax.tick_params(axis='x', rotation=45)
+
+    fig.tight_layout()
+    return fig
+
+
+MATPLOTLIB_DRAWERS = {
+    'message': draw_message,
+    'bar': draw_bar,
+    'pie': draw_pie,
+    'heatmap': draw_heatmap,
+    'stacked_bar': draw_stacked_bar,
+}
+
+
+def matplotlib_figure(spec):
+    return MATPLOTLIB_DRAWERS[spec['kind']](spec)
+
+
+def render_png(fig):
+    """Render a figure to PNG bytes the way gr.Plot does"""
+    with io.BytesIO() as buffer:
+        fig.savefig(buffer, format="png")
+        return buffer.getvalue()
+
+
+# What gr.Plot receives for a server-rendered chart
+class PrerenderedFigure(Figure):
+    """Figure that replays already-rendered PNG bytes when gr.Plot saves it"""
+
+    def __init__(self, png):
+        super().__init__()
+        self.png = png
+        self.nbytes = len(png)
+
+    def savefig(self, fname, *args, **kwargs):
+        fname.write(self.png)
@@ -0,0 +1,302 @@
+"""Match free-text product and contaminant names to the dataset's values.
+
+Sample and product records name things their own way ("frozen ackee",
+"corn grits, flaking"), so the exact-value filters cannot classify them. A
+NameMatcher is built from the distinct values of a column plus the aliases
+of the synonym file, and ranks the values for a name in two ways:
+
+- exact token hits: an Aho-Corasick automaton over the token sequences of
+  every value, of the parts a value lists ("Canned ackee, frozen ackee,
+  and other ackee products") and of every alias finds all of them that
+  occur in the name in one pass over its tokens. The hit part of a value
+  is the share of the name's tokens its phrases cover.
+- fuzzy similarity: a trigram index over the same phrases gives the Dice
+  coefficient between the name's trigrams and a value's closest phrase,
+  which ranks misspellings and word-order variants.
+
+Names and phrases are compared as lower-cased tokens with filler words
+("and", "other", "products") dropped and plurals folded ("grits" matches
+"grit"). Phrases after "except" or "other than" are left out, so "wild
+rice" does not match "Cereal grains (except ... wild rice)". A value's
+score is ``HIT_WEIGHT`` times its hit part plus the rest times its
+similarity, between 0 and 1. Only the ``CANDIDATES`` most similar values
+and the values with token hits are scored, so the cost of a name follows
+its length and the postings of its trigrams, not the size of the
+vocabulary; ``classify`` matches every distinct name of a batch once.
+
+    python name_matcher.py names.txt --column Commodity -k 3
+"""
+import argparse
+import collections
+import csv
+import heapq
+import logging
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from csv_source import normalize_text
+from search_index import ngrams
+
+logger = logging.getLogger(__name__)
+
+# Aliases mapping other names to dataset values: column, alias, value
+SYNONYMS_PATH = 'data/synonyms.csv'
+
+# Columns names are matched against
+MATCH_COLUMNS = ['Contaminant', 'Commodity']
+
+# Weight of the exact token hits in a score; the rest is trigram similarity
+HIT_WEIGHT = 0.6
+
+# Most similar values scored per name, besides the values with token hits
+CANDIDATES = 50
+
+TOKEN = re.compile(r'[^\W_]+')
+
+# Words that qualify a list rather than name anything
+STOPWORDS = {'a', 'an', 'and', 'or', 'of', 'the', 'for', 'to', 'in', 'with', 'by', 'as', 'e', 'g', 'eg',
+             'etc', 'other', 'product', 'products'}
+
+# What a value lists its parts with, outside parentheses
+PART_SEPARATORS = re.compile(r',|;|\s-\s|\s\+\s|&|\band\b|\bor\b', re.IGNORECASE)
+
+# Parenthesized or trailing exclusions: "(except buckwheat, millet)", ", except snap beans"
+EXCLUSION = re.compile(r'\(\s*(?:except|excluding|other than)\b[^)]*\)|,?\s*\bexcept\b[^(),]*', re.IGNORECASE)
+
+PARENTHESIZED = re.compile(r'\(([^)]*)\)')
+
+# A parenthesized list of examples, split into parts like the top level
+EXAMPLES = re.compile(r'^\s*e\.?\s*g\.?,?\s*', re.IGNORECASE)
+
+
+def stem(token):
+    """Fold simple English plurals: berries -> berry, tomatoes -> tomato, grits -> grit"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('oes'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def name_tokens(text):
+    """Lower-cased, singular tokens of a name without filler words"""
+    if not isinstance(text, str):
+        return ()
+    return tuple(stem(token) for token in TOKEN.findall(normalize_text(text).casefold()) if token not in STOPWORDS)
+
+
+def value_phrases(value):
+    """Token tuples a value is matched on: the whole value and each part it lists.
+
+    "Canned ackee, frozen ackee, and other ackee products" gives the whole
+    value, (canned, ackee), (frozen, ackee) and (ackee,). A parenthesized
+    list of examples is split the same way; any other parenthesized text,
+    such as "(fresh, frozen or processed)", stays one phrase, and
+    exclusions are dropped.
+    """
+    phrases = [name_tokens(value)]
+    included = EXCLUSION.sub(' ', value)
+    for inner in PARENTHESIZED.findall(included):
+        if EXAMPLES.match(inner):
+            phrases.extend(name_tokens(part) for part in PART_SEPARATORS.split(EXAMPLES.sub('', inner)))
+        else:
+            phrases.append(name_tokens(inner))
+    phrases.extend(name_tokens(part) for part in PART_SEPARATORS.split(PARENTHESIZED.sub(' ', included)))
+    return list(dict.fromkeys(phrase for phrase in phrases if phrase))
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton over token sequences.
+
+    Finds every occurrence of every pattern in a list of tokens in a single
+    pass, however many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        # (pattern id, pattern length) of every pattern ending at a state
+        self.outputs = [[]]
+        for pattern_id, tokens in enumerate(patterns):
+            state = 0
+            for token in tokens:
+                child = self.goto[state].get(token)
+                if child is None:
+                    child = self.goto[state][token] = len(self.goto)
+                    self.goto.append({})
+                    self.outputs.append([])
+                state = child
+            self.outputs[state].append((pattern_id, len(tokens)))
+
+        # Failure links in breadth-first order, so a state's link is set before its children's
+        self.fail = [0] * len(self.goto)
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(token, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def find(self, tokens):
+        """(pattern id, first position, end position) of every pattern occurring in tokens"""
+        state = 0
+        for end, token in enumerate(tokens, 1):
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            for pattern_id, length in self.outputs[state]:
+                yield pattern_id, end - length, end
+
+
+class NameMatcher:
+    """Ranks the values of a column for free-text names.
+
+    ``aliases`` maps other names to one of the values; they are matched
+    like the value's own phrases.
+    """
+
+    def __init__(self, values, aliases=None):
+        self.values = list(values)
+        phrase_entries = {}
+        for entry, value in enumerate(self.values):
+            for phrase in value_phrases(value):
+                phrase_entries.setdefault(phrase, set()).add(entry)
+        entries = {value: entry for entry, value in enumerate(self.values)}
+        for alias, value in (aliases or {}).items():
+            phrase = name_tokens(alias)
+            if phrase and value in entries:
+                phrase_entries.setdefault(phrase, set()).add(entries[value])
+
+        phrases = list(phrase_entries)
+        self.phrase_entries = [sorted(phrase_entries[phrase]) for phrase in phrases]
+        self.automaton = TokenAutomaton(phrases)
+
+        # Trigram postings of the (phrase, entry) keys
+        keys = [(phrase, entry) for phrase in phrases for entry in phrase_entries[phrase]]
+        grams = {}
+        sizes = []
+        for key, (phrase, _) in enumerate(keys):
+            phrase_grams = ngrams(padded(phrase))
+            sizes.append(len(phrase_grams))
+            for gram in phrase_grams:
+                grams.setdefault(gram, []).append(key)
+        self.grams = {gram: np.array(posting, dtype=np.int32) for gram, posting in grams.items()}
+        self.key_sizes = np.array(sizes, dtype=np.int64)
+        self.key_entries = np.array([entry for _, entry in keys], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.values)
+
+    def similar(self, tokens):
+        """{entry: Dice similarity of its closest phrase} for the CANDIDATES most similar entries"""
+        grams = ngrams(padded(tokens))
+        postings = [self.grams[gram] for gram in grams if gram in self.grams]
+        if not postings:
+            return {}
+        keys, shared = np.unique(np.concatenate(postings), return_counts=True)
+        similarity = 2 * shared / (len(grams) + self.key_sizes[keys])
+        # Best phrase per entry: the first of each entry once sorted by similarity
+        order = np.argsort(-similarity, kind='stable')
+        entries, first = np.unique(self.key_entries[keys][order], return_index=True)
+        best = similarity[order][first]
+        if len(entries) > CANDIDATES:
+            top = np.argpartition(-best, CANDIDATES)[:CANDIDATES]
+            entries, best = entries[top], best[top]
+        return dict(zip(entries.tolist(), best.tolist()))
+
+    def match(self, name, k=5):
+        """Top ``k`` (value, score) pairs for a name, best first"""
+        tokens = name_tokens(name)
+        if not tokens:
+            return []
+        covered = {}
+        for pattern_id, start, end in self.automaton.find(tokens):
+            for entry in self.phrase_entries[pattern_id]:
+                covered.setdefault(entry, set()).update(range(start, end))
+        similar = self.similar(tokens)
+
+        scores = {
+            entry: HIT_WEIGHT * len(covered.get(entry, ())) / len(tokens) + (1 - HIT_WEIGHT) * similar.get(entry, 0.0)
+            for entry in similar.keys() | covered.keys()
+        }
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.values[entry], round(score, 4)) for entry, score in best]
+
+    def classify(self, names, k=1, min_score=0.0):
+        """DataFrame of name, rank, match and score: the top k matches of every name at or above min_score.
+
+        Each distinct name is matched once; names without a match get one
+        row with an empty match.
+        """
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+        matches = [[(value, score) for value, score in self.match(name, k) if score >= min_score] for name in uniques]
+        rows = []
+        for name, code in zip(names, codes):
+            found = matches[code] if code >= 0 else []
+            rows.extend((name, rank, value, score) for rank, (value, score) in enumerate(found, 1))
+            if not found:
+                rows.append((name, None, None, None))
+        return pd.DataFrame(rows, columns=['name', 'rank', 'match', 'score']).astype({'rank': 'Int64'})
+
+
+def padded(tokens):
+    """Text the trigrams of a token tuple are taken from, padded so word edges count"""
+    return f" {' '.join(tokens)} "
+
+
+def read_synonyms(path=SYNONYMS_PATH):
+    """{column: {alias: value}} from a synonym CSV (column, alias, value); empty when there is none"""
+    synonyms = {}
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                synonyms.setdefault(row['column'], {})[normalize_text(row['alias'])] = normalize_text(row['value'])
+    except FileNotFoundError:
+        logger.info("No synonym file at %s; matching on the dataset's values only", path)
+    return synonyms
+
+
+def build_matcher(dataset, column, synonyms=None):
+    """NameMatcher over a column's distinct values and its aliases in ``synonyms`` (read_synonyms)"""
+    values = [value for value in dataset.engine.columns[column].categories if isinstance(value, str)]
+    aliases = (synonyms if synonyms is not None else read_synonyms()).get(column, {})
+    unknown = sorted(set(aliases.values()) - set(values))
+    if unknown:
+        logger.warning("Synonyms for %s values that are not in the dataset: %s", column, ", ".join(unknown))
+    return NameMatcher(values, aliases)
+
+
+def main():
+    from dataset import DATA_PATH, Dataset
+    from snapshot import SNAPSHOT_DIR
+
+    parser = argparse.ArgumentParser(description="Match free-text names to the dataset's contaminants or commodities")
+    parser.add_argument('names', help="text file with one name per line ('-' for standard input)")
+    parser.add_argument('--column', choices=MATCH_COLUMNS, default='Commodity', help="column to match (default: %(default)s)")
+    parser.add_argument('-k', type=int, default=1, help="matches per name (default: %(default)s)")
+    parser.add_argument('--min-score', type=float, default=0.0, help="leave out weaker matches (default: %(default)s)")
+    parser.add_argument('--synonyms', default=SYNONYMS_PATH, help="synonym CSV (default: %(default)s)")
+    parser.add_argument('--csv', default=DATA_PATH, help="limits dataset (default: %(default)s)")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR, help="snapshot directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    matcher = build_matcher(Dataset.load(args.csv, args.snapshot_dir), args.column, read_synonyms(args.synonyms))
+    if args.names == '-':
+        names = sys.stdin.read().splitlines()
+    else:
+        with open(args.names, encoding='utf-8') as f:
+            names = f.read().splitlines()
+    matcher.classify(names, args.k, args.min_score).to_csv(sys.stdout, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
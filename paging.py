@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class TablePager:
+    """Serve sorted pages of a row selection without materializing it.
+
+    Sorting uses a per-column rank for every row, computed once from the
+    filter engine's categories (which are few compared to rows) and cached.
+    Ranks are made unique by folding in the row position, so every page of
+    a selection comes from one consistent total order, and the first pages
+    only need a partial sort.
+    """
+
+    def __init__(self, engine, sort_keys=None):
+        self.engine = engine
+        # Optional per-column functions returning arrays (most significant
+        # first) that rank rows better than the column's text order
+        self.sort_keys = sort_keys or {}
+        self.ranks = {}
+
+    def rank(self, column):
+        """Unique int64 sort key per row for one column"""
+        if len(self.ranks.get(column, ())) != self.engine.n_rows:
+            if column in self.sort_keys:
+                order = np.lexsort(self.sort_keys[column]()[::-1])
+                rank = np.empty(len(order), dtype=np.int64)
+                rank[order] = np.arange(len(order))
+            else:
+                index = self.engine.columns[column]
+                labels = [str(value).lower() for value in index.categories]
+                code_rank = np.empty(len(labels), dtype=np.int64)
+                code_rank[sorted(range(len(labels)), key=labels.__getitem__)] = np.arange(len(labels))
+                rank = code_rank[index.codes] * len(index.codes) + np.arange(len(index.codes))
+            self.ranks[column] = rank
+        return self.ranks[column]
+
+    def page(self, row_ids, page, page_size, sort_column=None, descending=False):
+        """Return (row ids on the page, clamped page number, page count).
+
+        Pages are numbered from 1. Without a sort column rows keep table
+        order.
+        """
+        total = len(row_ids)
+        pages = max(1, -(-total // page_size))
+        page = min(max(1, int(page)), pages)
+        start, end = (page - 1) * page_size, min(page * page_size, total)
+
+        if sort_column is None or total == 0:
+            return row_ids[start:end], page, pages
+
+        keys = self.rank(sort_column)[row_ids]
+        if descending:
+            keys = -keys
+        if end < total // 4:
+            # Only the rows up to the end of the page need to be ordered
+            head = np.argpartition(keys, end - 1)[:end]
+            order = head[np.argsort(keys[head])]
+        else:
+            order = np.argsort(keys)
+        return row_ids[order[start:end]], page, pages
@@ -0,0 +1,221 @@
+"""Ranked, typo-tolerant search over the text columns.
+
+The exact search box only finds rows containing the term as typed, so
+"cadmuim" or "nitrosodimethyl amine" find nothing. Ranked search instead
+looks every query word up in a dictionary of the words in the searched
+columns, allowing a few typos, and ranks rows by BM25.
+
+The dictionary follows SymSpell: every word is stored under each string
+made by deleting up to ``max_edits`` of its characters, so the words
+within reach of a query word are the ones sharing one of its own deletes,
+found with dictionary lookups instead of a scan of the vocabulary. The
+candidates are confirmed with the edit distance (transpositions count as
+one edit). Two adjacent query words are also tried joined, so a word typed
+with a space in it still matches, and a word also matches the words it
+starts ("pcb" finds "pcbs") as if one edit away.
+
+Rows are ranked first by how many query words they match, in any
+column, and then by score, so a row matching every word beats one
+matching a single word very well. Rows are scored per column with BM25
+and the columns are weighted by ``FIELDS``. A column's BM25 contribution only depends on the row's value
+in it, so the impact of every word on every distinct value is computed
+when the index is built, and a query adds up a few per-value arrays and
+reads them out for the rows holding a matching value. Only the ``k`` best
+rows are kept, with a partial sort.
+"""
+import bisect
+import collections
+import math
+import re
+
+import numpy as np
+
+from filter_engine import EMPTY_ROWS
+
+# Searched columns and their weights
+FIELDS = {'Contaminant': 2.0, 'Commodity': 2.0, 'Reference': 1.0, 'Notes': 0.5}
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+# Score factor per edit between a query word and a dictionary word
+TYPO_DISCOUNT = 0.8
+
+# Most words a query word is completed to
+COMPLETIONS = 20
+
+# Rows returned by a ranked search
+TOP_K = 100
+
+# Query words past this many are ignored
+MAX_WORDS = 32
+
+TOKEN = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    """Lower-cased words of a cell or query; apostrophes are dropped, so "PCB's" is one word"""
+    return TOKEN.findall(text.casefold().replace("'", "")) if isinstance(text, str) else []
+
+
+def max_edits(word):
+    """Typos allowed in a word: none up to 3 characters, one up to 7, two beyond"""
+    return 0 if len(word) <= 3 else 1 if len(word) <= 7 else 2
+
+
+def deletes(word, edits):
+    """The word and every string made by deleting up to ``edits`` of its characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(edits):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a, b, limit):
+    """Edit distance counting adjacent transpositions as one edit; anything above limit is limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class TermDictionary:
+    """Words of the searched columns, indexed by their deletes for typo-tolerant lookup"""
+
+    def __init__(self, terms):
+        self.terms = sorted(terms)
+        self.deletes = {}
+        for term in terms:
+            for variant in deletes(term, max_edits(term)):
+                self.deletes.setdefault(variant, []).append(term)
+
+    def lookup(self, word):
+        """{term: edits} of the dictionary words within max_edits(word) of the word"""
+        limit = max_edits(word)
+        candidates = {term for variant in deletes(word, limit) for term in self.deletes.get(variant, ())}
+        found = {}
+        for term in candidates:
+            distance = 0 if term == word else edit_distance(word, term, limit)
+            if distance <= limit:
+                found[term] = distance
+        return found
+
+    def completions(self, word, limit=COMPLETIONS):
+        """Up to ``limit`` dictionary words longer than the word that start with it"""
+        start = bisect.bisect_right(self.terms, word)
+        end = bisect.bisect_left(self.terms, word + '\uffff', start)
+        return self.terms[start:min(end, start + limit)]
+
+
+class RankedSearch:
+    """BM25 search with typo-tolerant word lookup over the FIELDS columns of a filter engine"""
+
+    def __init__(self, engine, fields=FIELDS):
+        self.engine = engine
+        self.fields = {field: weight for field, weight in fields.items() if field in engine.columns}
+        # word -> [(field, value codes, impact on each value)]
+        self.postings = {}
+        n_rows = max(engine.n_rows, 1)
+        for field, weight in self.fields.items():
+            index = engine.columns[field]
+            value_words = [collections.Counter(words(value)) for value in index.categories]
+            lengths = np.array([sum(counts.values()) for counts in value_words], dtype=float)
+            average = float(lengths @ index.counts) / n_rows or 1.0
+
+            by_word = {}
+            for code, counts in enumerate(value_words):
+                for word, tf in counts.items():
+                    by_word.setdefault(word, []).append((code, tf))
+            for word, hits in by_word.items():
+                codes = np.array([code for code, _ in hits], dtype=np.int64)
+                tf = np.array([tf for _, tf in hits], dtype=float)
+                # Document frequency counts rows, not distinct values
+                df = float(index.counts[codes].sum())
+                idf = math.log(1 + (n_rows - df + 0.5) / (df + 0.5))
+                impact = weight * idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[codes] / average))
+                self.postings.setdefault(word, []).append((field, codes, impact))
+        self.dictionary = TermDictionary(self.postings)
+
+    def expand(self, query):
+        """(bit mask of the query words covered, {term: weight}) per query word, plus one per pair of
+        adjacent words spelling a term when joined"""
+        query_words = words(query)[:MAX_WORDS]
+        groups = [
+            (1 << i, {**dict.fromkeys(self.dictionary.completions(word), 1), **self.dictionary.lookup(word)})
+            for i, word in enumerate(query_words)
+        ]
+        groups += [
+            (3 << i, self.dictionary.lookup(first + second))
+            for i, (first, second) in enumerate(zip(query_words, query_words[1:]))
+        ]
+        return [
+            (mask, {term: TYPO_DISCOUNT ** distance for term, distance in group.items()})
+            for mask, group in groups if group
+        ]
+
+    def value_scores(self, query):
+        """({field: score of every value}, {field: bit mask of the query words every value matches});
+        a query word adds its best matching term's impact"""
+        scores = {field: np.zeros(len(self.engine.columns[field].categories)) for field in self.fields}
+        covered = {field: np.zeros(len(values), dtype=np.int64) for field, values in scores.items()}
+        for mask, group in self.expand(query):
+            best = {field: np.zeros(len(values)) for field, values in scores.items()}
+            for term, weight in group.items():
+                for field, codes, impact in self.postings[term]:
+                    np.maximum.at(best[field], codes, weight * impact)
+            for field in scores:
+                scores[field] += best[field]
+                covered[field][best[field] > 0] |= mask
+        return scores, covered
+
+    def search(self, query, row_ids=None, k=TOP_K):
+        """(row ids, scores) of the k best rows for a query, best first; restricted to sorted row_ids if given.
+
+        With k None every row scoring above zero is returned, in row order.
+        """
+        scores, covered = self.value_scores(query)
+        matches = [
+            self.engine.columns[field].postings(int(code))
+            for field, values in scores.items() for code in np.flatnonzero(values)
+        ]
+        if not matches:
+            return EMPTY_ROWS, np.empty(0)
+        rows = np.unique(np.concatenate(matches))
+        if row_ids is not None and len(row_ids) < self.engine.n_rows:
+            rows = np.intersect1d(rows, row_ids, assume_unique=True)
+            if not len(rows):
+                return EMPTY_ROWS, np.empty(0)
+        row_scores = np.zeros(len(rows))
+        row_masks = np.zeros(len(rows), dtype=np.int64)
+        for field, values in scores.items():
+            codes = self.engine.columns[field].codes[rows]
+            row_scores += values[codes]
+            row_masks |= covered[field][codes]
+        if k is None:
+            return rows, row_scores
+
+        coverage = np.zeros(len(rows), dtype=np.int64)
+        for bit in range(int(row_masks.max()).bit_length()):
+            coverage += (row_masks >> bit) & 1
+        if len(rows) > k:
+            # Scores are below the largest plus one, so this orders by coverage, then score
+            rank = coverage * (row_scores.max() + 1) + row_scores
+            top = np.argpartition(-rank, k - 1)[:k]
+            rows, row_scores, coverage = rows[top], row_scores[top], coverage[top]
+        # Most query words matched first, then best score; equal rows keep row order
+        order = np.lexsort((rows, -row_scores, -coverage))
+        return rows[order], row_scores[order]
@@ -0,0 +1,98 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path):
+    """Cheap change detector for the watched file: (mtime, size)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DatasetReloader:
+    """Keep the served dataset in sync with its CSV without restarting.
+
+    A daemon thread polls the file's modification time and size. When they
+    change and then hold still for one more poll (so a file that is still
+    being written is not picked up), the dataset and its indexes are rebuilt
+    on that thread while requests keep using the current one. The new
+    dataset is published with a single reference assignment, so handlers
+    that read ``current`` once per request finish on the version they
+    started with. ``on_swap(old, new)`` runs after each swap, e.g. to evict
+    cache entries of the old version.
+
+    ``extend(current, path)``, when given, is tried first: it returns the
+    current dataset plus the rows appended to the file since it was read,
+    or None when the file changed in another way and needs a full ``load``.
+    """
+
+    def __init__(self, path, load, interval=5.0, on_swap=None, extend=None):
+        self.path = path
+        self.load = load
+        self.extend = extend
+        self.interval = interval
+        self.on_swap = on_swap
+        self.signature = file_signature(path)
+        self.current = load(path)
+        self.reloads = 0
+        self.failures = 0
+        self._pending = None
+        self._stop = threading.Event()
+        self._thread = None
+        # Serializes reloads started by the watcher and by explicit calls
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='dataset-reloader', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """Reload if the file changed and has been stable since the last poll"""
+        signature = file_signature(self.path)
+        if signature is None or signature == self.signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        self._pending = None
+        return self.reload(signature)
+
+    def reload(self, signature=None):
+        """Rebuild the dataset and swap it in; the old one keeps serving on failure"""
+        with self._lock:
+            signature = signature or file_signature(self.path)
+            try:
+                dataset = self.extend(self.current, self.path) if self.extend else None
+                if dataset is None:
+                    dataset = self.load(self.path)
+            except Exception:
+                self.failures += 1
+                logger.exception("Reloading %s failed; still serving version %s", self.path, self.current.version)
+                return False
+
+            self.signature = signature
+            if dataset.version == self.current.version:
+                # Touched but unchanged contents
+                return False
+
+            old, self.current = self.current, dataset
+            self.reloads += 1
+            logger.info("Reloaded %s: version %s -> %s", self.path, old.version, dataset.version)
+            if self.on_swap:
+                self.on_swap(old, dataset)
+            return True
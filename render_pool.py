@@ -0,0 +1,201 @@
+"""Worker processes that render matplotlib chart specs to PNG.
+
+Matplotlib layout and rasterization are CPU-bound Python, so renders
+running on the request threads serialize on the GIL. A RenderPool keeps a
+few separate Python processes that receive chart specs (a few hundred
+bytes of aggregated series; the dataset itself never leaves the app) and
+send back PNG bytes, so chart throughput scales with cores.
+
+Workers are plain interpreters running this file, talking over their
+stdin/stdout pipes. They never import the app module, so starting one
+costs a matplotlib import, not a dataset load. The pool bounds the work it
+accepts (RenderPoolBusy when full) and kills and replaces a worker whose
+render exceeds the timeout (RenderTimeout).
+"""
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection
+
+
+class RenderPoolBusy(Exception):
+    """Raised when the pool already holds its maximum number of pending renders"""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render does not finish within the pool's timeout"""
+
+
+class RenderWorker:
+    """One worker process and the pipes to it"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        # Connections take their own descriptors, so the Popen file objects can go
+        self.requests = Connection(os.dup(self.process.stdin.fileno()), readable=False)
+        self.responses = Connection(os.dup(self.process.stdout.fileno()), writable=False)
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+    def close(self):
+        self.requests.close()
+        self.responses.close()
+        self.process.kill()
+        self.process.wait()
+
+
+class RenderPool:
+    """Render chart specs to PNG bytes in ``workers`` processes.
+
+    ``render`` blocks the calling thread until its PNG is ready. At most
+    ``max_pending`` renders (running plus waiting for a worker) are
+    accepted at once; beyond that ``render`` raises RenderPoolBusy right
+    away instead of queueing more work than the workers can finish.
+    """
+
+    def __init__(self, workers=2, max_pending=None, timeout=10.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending or 4 * workers
+        self.idle = queue.LifoQueue()
+        self.started = 0
+        self.pending = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start all workers now rather than on the first renders"""
+        while True:
+            with self.lock:
+                if self.started >= self.workers:
+                    return self
+                self.started += 1
+            try:
+                self.idle.put(RenderWorker())
+            except Exception:
+                with self.lock:
+                    self.started -= 1
+                raise
+
+    def render(self, spec):
+        """PNG bytes of a matplotlib chart spec"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise RenderPoolBusy()
+            self.pending += 1
+        try:
+            return self._render(spec, time.monotonic() + self.timeout)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def _render(self, spec, deadline):
+        worker = self._acquire(deadline)
+        try:
+            worker.requests.send(spec)
+            if not worker.responses.poll(max(0.0, deadline - time.monotonic())):
+                with self.lock:
+                    self.timeouts += 1
+                raise RenderTimeout()
+            ok, result = worker.responses.recv()
+        except RenderTimeout:
+            # A stuck worker is replaced rather than reused
+            self._discard(worker)
+            raise
+        except (OSError, EOFError) as e:
+            self._discard(worker)
+            with self.lock:
+                self.failures += 1
+            raise RuntimeError(f"Chart render worker failed: {e}") from e
+        self.idle.put(worker)
+        if not ok:
+            with self.lock:
+                self.failures += 1
+            raise RuntimeError(f"Chart rendering failed: {result}")
+        with self.lock:
+            self.rendered += 1
+        return result
+
+    def _acquire(self, deadline):
+        """An idle worker, starting one if the pool is not at full size yet"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            start = self.started < self.workers
+            if start:
+                self.started += 1
+        if start:
+            try:
+                return RenderWorker()
+            except Exception:
+                with self.lock:
+                    self.started -= 1
+                raise
+        try:
+            return self.idle.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            with self.lock:
+                self.timeouts += 1
+            raise RenderTimeout()
+
+    def _discard(self, worker):
+        worker.close()
+        with self.lock:
+            self.started -= 1
+
+    def close(self):
+        """Stop the idle workers"""
+        while True:
+            try:
+                self._discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.started,
+                'pending': self.pending,
+                'rendered': self.rendered,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+            }
+
+
+def serve():
+    """Worker loop: read specs from stdin, write (ok, png or error) to stdout"""
+    requests = Connection(os.dup(sys.stdin.fileno()), writable=False)
+    responses = Connection(os.dup(sys.stdout.fileno()), readable=False)
+    # Keep stray prints from the chart code off the response pipe
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    from matplotlib_charts import matplotlib_figure, render_png
+
+    while True:
+        try:
+            spec = requests.recv()
+        except EOFError:
+            return
+        try:
+            responses.send((True, render_png(matplotlib_figure(spec))))
+        except Exception as e:
+            responses.send((False, str(e)))
+
+
+if __name__ == '__main__':
+    serve()
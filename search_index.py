@@ -0,0 +1,95 @@
+import numpy as np
+
+from filter_engine import EMPTY_ROWS
+
+GRAM_SIZE = 3
+
+
+def ngrams(text, n=GRAM_SIZE):
+    """Set of overlapping character n-grams in a string"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SearchIndex:
+    """Trigram index over the distinct cell values of the searchable columns.
+
+    Matching follows the "Search across all fields" semantics: a row matches
+    when the lower-cased search term is a substring of ``str(cell).lower()``
+    for any of its cells. Because cells repeat heavily (level types, links,
+    references), the index is built over each column's distinct values taken
+    from the filter engine's column indexes rather than over rows. A query
+    intersects the posting sets of its trigrams, verifies the surviving
+    values with a real substring check, then expands them to row ids through
+    the engine's posting lists.
+    """
+
+    def __init__(self, engine, columns=None):
+        self.engine = engine
+        self.columns = list(columns) if columns is not None else list(engine.columns)
+        # Flat vocabulary across columns: entry id -> (column, code, lowered text)
+        self.entries = []
+        self.grams = {}
+        # Grams whose entry lists belong to this index and may be appended to in place
+        self.owned = set()
+        self.indexed = {column: 0 for column in self.columns}
+        self.update()
+
+    def update(self):
+        """Index values added to the engine's columns since the last update.
+
+        Call after ``FilterEngine.append``; existing entries are kept as is,
+        so the cost follows the number of new distinct values.
+        """
+        for column in self.columns:
+            categories = self.engine.columns[column].categories
+            for code in range(self.indexed[column], len(categories)):
+                text = str(categories[code]).lower()
+                entry = len(self.entries)
+                self.entries.append((column, code, text))
+                for gram in ngrams(text):
+                    if gram in self.owned:
+                        self.grams[gram].append(entry)
+                    else:
+                        # Lists shared with the index this one was extended from are copied on first write
+                        self.grams[gram] = self.grams.get(gram, []) + [entry]
+                        self.owned.add(gram)
+            self.indexed[column] = len(categories)
+
+    def extended(self, engine):
+        """Copy of this index for an engine with appended rows, updated with their new values"""
+        index = SearchIndex.__new__(SearchIndex)
+        index.engine = engine
+        index.columns = self.columns
+        index.entries = list(self.entries)
+        index.grams = dict(self.grams)
+        index.owned = set()
+        index.indexed = dict(self.indexed)
+        index.update()
+        return index
+
+    def matching_entries(self, term):
+        """Entry ids whose text contains the lower-cased term"""
+        term = term.lower()
+        query_grams = ngrams(term)
+        if query_grams:
+            postings = sorted((self.grams.get(gram, ()) for gram in query_grams), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+        else:
+            # Terms shorter than a trigram are checked against every entry
+            candidates = range(len(self.entries))
+        return [entry for entry in candidates if term in self.entries[entry][2]]
+
+    def search(self, term, row_ids=None):
+        """Sorted row ids matching the term, optionally restricted to row_ids"""
+        matches = [
+            self.engine.columns[column].postings(code)
+            for column, code, _ in (self.entries[entry] for entry in self.matching_entries(term))
+        ]
+        rows = np.unique(np.concatenate(matches)) if matches else EMPTY_ROWS
+        if row_ids is not None:
+            rows = np.intersect1d(rows, row_ids, assume_unique=True)
+        return rows
@@ -1,26 +1,19 @@
 import gradio as gr
-import pandas as pd
 import matplotlib.pyplot as plt
 
-# Load the data
-df = pd.read_csv('data/contaminant-levels.csv')
-
-# Clean column names and data
-df.columns = df.columns.str.strip()
-for col in df.columns:
-    if df[col].dtype == 'object':
-        df[col] = df[col].str.strip()
+import core
 
 # Create a simple visualization function
 def create_plot():
     """Create a simple bar chart using matplotlib"""
     plt.figure(figsize=(10, 6))
     
-    # Get top 10 contaminants
-    counts = df['Contaminant'].value_counts().nlargest(10)
+    # Get top 10 contaminants, from the dataset the core loads on first use
+    spec = core.chart_data("contaminant_distribution", core.select_rows(None, None, None, "", None, None))
+    labels, values = spec['labels'][:10], spec['values'][:10]
     
     # Create bar chart
-    plt.bar(counts.index, counts.values, color='blue')
+    plt.bar(labels, values, color='blue')
     
     # Style the chart
     plt.title('Top 10 Contaminants')
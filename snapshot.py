@@ -0,0 +1,159 @@
+"""Binary snapshot of the cleaned dataset, shared by every process serving it.
+
+The snapshot stores every text column as int32 categorical codes plus its
+category list, together with the filter engine's posting-list order, and
+numeric columns (the parsed Level Value) as plain arrays. Arrays are
+written as .npy files and opened memory-mapped, so loading costs a
+dictionary lookup per column instead of a CSV parse, string stripping and
+re-encoding, and all processes that open the same snapshot share one copy
+of the data in the page cache. Each snapshot lives in a directory named
+after the content hash of the CSV it was built from, and is only used when
+that hash matches the current file.
+
+The app publishes the snapshot itself the first time it loads a CSV
+version. To build or refresh it ahead of time:
+
+    python snapshot.py
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from caching import file_digest
+from column_store import ColumnStore
+from filter_engine import ColumnIndex
+
+SNAPSHOT_DIR = 'data/snapshot'
+
+# Bumped whenever the on-disk layout or the cleaning of the data changes
+FORMAT_VERSION = 2
+
+
+def snapshot_path(snapshot_dir, version):
+    return os.path.join(snapshot_dir, version)
+
+
+def write_snapshot(store, version, snapshot_dir=SNAPSHOT_DIR):
+    """Write a ColumnStore as the snapshot for ``version``.
+
+    The snapshot is written to a temporary directory and renamed into
+    place, then snapshots of other versions are removed. Processes still
+    serving an old version keep their mappings of the removed files.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    target = snapshot_path(snapshot_dir, version)
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    columns = []
+    for i, column in enumerate(store.columns):
+        if column in store.values:
+            np.save(os.path.join(staging, f'{i}.values.npy'), np.asarray(store.values[column]))
+            columns.append({'name': column, 'kind': 'values', 'dtype': str(store.dtype(column))})
+            continue
+
+        index = store.indexes[column]
+        np.save(os.path.join(staging, f'{i}.codes.npy'), np.asarray(index.codes, dtype=np.int32))
+        np.save(os.path.join(staging, f'{i}.order.npy'), np.asarray(index.posting_order(), dtype=np.int32))
+        columns.append({
+            'name': column,
+            'kind': 'categorical',
+            'categories': [None if pd.isna(value) else value for value in index.categories],
+        })
+
+    manifest = {'format': FORMAT_VERSION, 'version': version, 'rows': len(store), 'columns': columns}
+    with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    for name in os.listdir(snapshot_dir):
+        if name != version and not name.startswith('.'):
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+    return target
+
+
+def read_snapshot(snapshot_dir, version):
+    """Open the snapshot built for ``version`` as a ColumnStore, or return None if there is none"""
+    path = snapshot_path(snapshot_dir, version)
+    try:
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != FORMAT_VERSION or manifest.get('version') != version:
+        return None
+
+    values = {}
+    indexes = {}
+    for i, column in enumerate(manifest['columns']):
+        name = column['name']
+        if column['kind'] == 'values':
+            values[name] = np.load(os.path.join(path, f'{i}.values.npy'), mmap_mode='r')
+            continue
+
+        categories = [np.nan if value is None else value for value in column['categories']]
+        codes = np.load(os.path.join(path, f'{i}.codes.npy'), mmap_mode='r')
+        order = np.load(os.path.join(path, f'{i}.order.npy'), mmap_mode='r')
+        indexes[name] = ColumnIndex(codes, categories, order=order)
+
+    return ColumnStore([column['name'] for column in manifest['columns']], indexes, values)
+
+
+@contextlib.contextmanager
+def snapshot_lock(snapshot_dir):
+    """Exclusive lock so only one process at a time publishes a snapshot"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, '.lock'), 'w') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def publish_snapshot(version, build, snapshot_dir=SNAPSHOT_DIR):
+    """Open the snapshot for ``version``, building and writing it first if needed.
+
+    ``build`` returns the ColumnStore to write. Processes loading the same
+    version concurrently wait for the first one to write it and then map
+    its files, so the data is parsed once and shared by all of them.
+    """
+    with snapshot_lock(snapshot_dir):
+        store = read_snapshot(snapshot_dir, version)
+        if store is None:
+            write_snapshot(build(), version, snapshot_dir)
+            store = read_snapshot(snapshot_dir, version)
+    return store
+
+
+def main():
+    from dataset import DATA_PATH, read_csv_data
+
+    parser = argparse.ArgumentParser(description="Build the binary snapshot of the contaminant dataset")
+    parser.add_argument('--csv', default=DATA_PATH, help="source CSV (default: %(default)s)")
+    parser.add_argument('--out', default=SNAPSHOT_DIR, help="snapshot directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    # Always encode from the CSV so a stale snapshot is never copied forward
+    store = ColumnStore.from_frame(read_csv_data(args.csv))
+    with snapshot_lock(args.out):
+        path = write_snapshot(store, file_digest(args.csv), args.out)
+    print(f"Wrote snapshot of {len(store)} rows to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Precompiled data shards for the static site (index.html + app.js).
+
+Instead of downloading and parsing the raw CSV in the browser, the static
+site loads a small manifest and the shards it names:
+
+- rows: the cleaned table, dictionary-encoded. Every column is a sorted
+  list of distinct values plus one integer code per row.
+- summary: the filter options with their row counts (the same values and
+  counts the Gradio dropdowns show) and the row count per contaminant for
+  the unfiltered chart.
+
+Shard file names carry a hash of their contents, so they can be served with
+long-lived cache headers; only manifest.json has to be revalidated. The
+shards of the previous manifest are kept for one more export, so a client
+that loaded it just before an export can still fetch them; older shards are
+removed. No other file in the directory is touched.
+
+Rebuild the shards after updating the CSV:
+
+    python static_export.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATA_PATH, Dataset
+from snapshot import SNAPSHOT_DIR
+
+STATIC_DIR = 'data/static'
+
+# Bumped whenever the shard layout changes
+FORMAT_VERSION = 1
+
+# Columns the static site filters on
+OPTION_COLUMNS = ['Contaminant', 'Commodity', 'Contaminant Level Type']
+
+# Names write_shard gives its files; only these are ever removed
+SHARD_NAME = re.compile(r'^(?:rows|summary)\.[0-9a-f]{16}\.json$')
+
+
+def sorted_dictionary(index):
+    """Sorted distinct values of a column and the remapped code of every row"""
+    labels = ['' if pd.isna(value) else value for value in index.categories]
+    order = sorted(range(len(labels)), key=labels.__getitem__)
+    remap = np.empty(len(labels), dtype=np.int64)
+    remap[order] = np.arange(len(labels))
+    return [labels[code] for code in order], remap[index.codes]
+
+
+def encode_rows(dataset):
+    """The source columns as {'columns', 'dictionaries', 'codes'}"""
+    dictionaries, codes = [], []
+    for column in dataset.source_columns:
+        values, column_codes = sorted_dictionary(dataset.engine.columns[column])
+        dictionaries.append(values)
+        codes.append(column_codes.tolist())
+    return {
+        'rows': dataset.engine.n_rows,
+        'columns': dataset.source_columns,
+        'dictionaries': dictionaries,
+        'codes': codes,
+    }
+
+
+def summarize(dataset):
+    """Filter options with counts, and row counts per contaminant (largest first)"""
+    options = {}
+    for column in OPTION_COLUMNS:
+        index = dataset.engine.columns[column]
+        options[column] = sorted(
+            [value, int(count)] for value, count in zip(index.categories, index.counts)
+            if count and not pd.isna(value)
+        )
+    contaminants = sorted(options['Contaminant'], key=lambda item: -item[1])
+    return {'rows': dataset.engine.n_rows, 'options': options, 'contaminant_counts': contaminants}
+
+
+def write_shard(out_dir, name, payload):
+    """Write one JSON shard named after its content hash; return the file name"""
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    file_name = f"{name}.{hashlib.sha256(data).hexdigest()[:16]}.json"
+    path = os.path.join(out_dir, file_name)
+    if not os.path.exists(path):
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+    return file_name
+
+
+def read_manifest(out_dir):
+    """The manifest currently in out_dir, or None"""
+    try:
+        with open(os.path.join(out_dir, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def export_static(dataset, out_dir=STATIC_DIR):
+    """Write the shards and manifest for ``dataset``; remove shards neither it nor the previous manifest uses"""
+    os.makedirs(out_dir, exist_ok=True)
+    previous = read_manifest(out_dir)
+    shards = {
+        'rows': write_shard(out_dir, 'rows', encode_rows(dataset)),
+        'summary': write_shard(out_dir, 'summary', summarize(dataset)),
+    }
+    manifest = {
+        'format': FORMAT_VERSION,
+        'version': dataset.version,
+        'last_modified': dataset.last_modified_date,
+        'shards': shards,
+    }
+
+    # The manifest is replaced last, so clients never see it point at a missing shard
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    keep = set(shards.values()) | set((previous or {}).get('shards', {}).values())
+    for name in os.listdir(out_dir):
+        if SHARD_NAME.match(name) and name not in keep:
+            os.remove(os.path.join(out_dir, name))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the static site's data shards")
+    parser.add_argument('--csv', default=DATA_PATH, help="source CSV (default: %(default)s)")
+    parser.add_argument('--out', default=STATIC_DIR, help="output directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    dataset = Dataset.load(args.csv, SNAPSHOT_DIR)
+    manifest = export_static(dataset, args.out)
+    sizes = ", ".join(
+        f"{name} {os.path.getsize(os.path.join(args.out, file_name)) // 1024} KiB"
+        for name, file_name in manifest['shards'].items()
+    )
+    print(f"Wrote {dataset.engine.n_rows} rows to {args.out} ({sizes})")
+
+
+if __name__ == '__main__':
+    main()
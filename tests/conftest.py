@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dataset import DATA_PATH, Dataset
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    """Copy of the dataset CSV that a test may append to"""
+    path = tmp_path / 'contaminant-levels.csv'
+    shutil.copy(os.path.join(ROOT, DATA_PATH), path)
+    return str(path)
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    return str(tmp_path / 'snapshot')
+
+
+@pytest.fixture
+def dataset(csv_path, snapshot_dir):
+    return Dataset.load(csv_path, snapshot_dir)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import Dataset, read_csv_data
+from ingest import append_rows, write_csv_rows
+from snapshot import read_snapshot
+
+NEW_ROWS = pd.DataFrame({
+    'Contaminant': [' Zincoid ', 'Lead'],
+    'Commodity': ['Rice bran', 'Brand new commodity'],
+    'Contaminant Level Type': ['Action Level', 'Guidance Level'],
+    'Level': ['5 ppb', '0.5 ppm'],
+    'Reference': ['CPG 1', 'CPG 2'],
+    'Link to Reference': ['http://example.com/1', 'http://example.com/2'],
+    'Notes': [None, 'new'],
+})
+
+
+def assert_same_rows(dataset, path):
+    pd.testing.assert_frame_equal(dataset.df, read_csv_data(path)[dataset.columns], check_dtype=False)
+
+
+def test_append_rows_cleans_raw_rows(dataset, csv_path, snapshot_dir):
+    extended, rejected = append_rows(NEW_ROWS, csv_path, snapshot_dir, dataset)
+
+    assert len(rejected) == 0
+    assert len(extended.store) == len(dataset.store) + 2
+    added = extended.take(np.arange(len(dataset.store), len(extended.store)))
+    assert list(added['Contaminant']) == ['Zincoid', 'Lead']
+    assert list(added['Commodity']) == ['Rice bran', 'Brand new commodity']
+    assert list(added['Level Value']) == [0.005, 0.5]
+    assert list(dataset.select({'Contaminant': ['Zincoid']})) == []
+    assert list(extended.select({'Contaminant': ['Zincoid']})) == [len(dataset.store)]
+    assert_same_rows(extended, csv_path)
+
+
+def test_append_rows_rejects_bad_rows(dataset, csv_path, snapshot_dir):
+    rows = NEW_ROWS.assign(Level=['5 ppb', 'lots'])
+    with pytest.raises(ValueError, match="1 of 2 new rows rejected"):
+        append_rows(rows, csv_path, snapshot_dir, dataset)
+    extended, rejected = append_rows(rows, csv_path, snapshot_dir, dataset, skip_rejected=True)
+    assert list(rejected['Problem']) == ["Level is not a number with a known unit"]
+    assert len(extended.store) == len(dataset.store) + 1
+
+
+def test_appended_version_is_published_and_mapped(dataset, csv_path, snapshot_dir):
+    extended, _ = append_rows(NEW_ROWS, csv_path, snapshot_dir, dataset)
+
+    assert extended.version != dataset.version
+    assert read_snapshot(snapshot_dir, extended.version) is not None
+    assert isinstance(extended.store.values['Level Value'], np.memmap)
+    assert isinstance(extended.store.indexes['Contaminant'].codes, np.memmap)
+
+    reopened = Dataset.load(csv_path, snapshot_dir, publish=False)
+    assert reopened.version == extended.version
+    assert isinstance(reopened.store.indexes['Contaminant'].codes, np.memmap)
+    pd.testing.assert_frame_equal(reopened.df, extended.df)
+    assert list(reopened.select({'Contaminant': ['Zincoid']})) == [len(dataset.store)]
+    assert_same_rows(reopened, csv_path)
+
+
+def test_extend_publishes_rows_appended_to_the_csv(dataset, csv_path, snapshot_dir):
+    write_csv_rows(csv_path, NEW_ROWS)
+    extended = dataset.extend(csv_path, snapshot_dir)
+
+    assert extended.base_version == dataset.version
+    assert isinstance(extended.store.indexes['Commodity'].codes, np.memmap)
+    assert read_snapshot(snapshot_dir, extended.version) is not None
+    assert list(extended.search_index.search('zincoid')) == [len(dataset.store)]
@@ -0,0 +1,23 @@
+import time
+
+from coalescing import RequestCoalescer
+
+
+def test_newer_job_supersedes_older_one_of_the_same_session():
+    coalescer = RequestCoalescer(delay=0)
+    first = coalescer.begin('session')
+    second = coalescer.begin('session')
+    other = coalescer.begin('other session')
+    assert not coalescer.is_current(first)
+    assert coalescer.is_current(second)
+    assert coalescer.is_current(other)
+
+
+def test_jobs_without_a_session_stand_alone():
+    coalescer = RequestCoalescer(delay=10)
+    first = coalescer.begin(None)
+    second = coalescer.begin(None)
+    start = time.monotonic()
+    assert coalescer.settle(first) and coalescer.settle(second)
+    assert time.monotonic() - start < 1
+    assert coalescer.stats()['sessions'] == 0
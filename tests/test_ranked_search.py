@@ -0,0 +1,22 @@
+import core
+
+
+def row_values(dataset, row_ids):
+    return list(dataset.take(row_ids, ['Contaminant', 'Commodity']).itertuples(index=False, name=None))
+
+
+def test_misspelled_query_ranks_row_matching_every_word_first(dataset):
+    rows = dataset.select({}, "aflatoxn peanuts", search_mode="ranked")
+    assert row_values(dataset, rows[:1]) == [("Aflatoxins, total", "Peanuts and peanut products")]
+
+
+def test_filters_excluding_every_ranked_hit_return_no_rows(dataset):
+    rows = dataset.select({'Contaminant': ['Lead']}, "cadmium", search_mode="ranked")
+    assert len(rows) == 0
+    choices = dataset.facet_options({'Contaminant': ['Lead']}, "cadmium", search_mode="ranked")
+    assert choices['Contaminant']
+
+
+def test_level_range_excluding_every_ranked_hit_returns_no_rows(dataset):
+    assert len(core.select_rows([], [], [], "cadmium", 10**9, None, "ppm", dataset=dataset,
+                                search_mode="ranked")) == 0
@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+import core
+from api import create_api
+
+
+def test_ui_and_api_stats_agree(dataset):
+    client = TestClient(create_api(lambda: dataset))
+    for params, args in [({'contaminant': 'Lead'}, (['Lead'], None, None, "", None, None)),
+                         ({'search': 'no such text'}, (None, None, None, "no such text", None, None))]:
+        api_stats = client.get('/stats', params=params).json()
+        ui_stats = core.filter_stats(core.filter_data(*args, dataset=dataset), dataset)
+        assert api_stats.pop('version') == dataset.version
+        assert ui_stats == {key: "N/A" if value is None else value for key, value in api_stats.items()}
+
+
+def test_stats_of_a_selection(dataset):
+    stats = core.filter_stats(core.select_rows(['Lead'], None, None, "", None, None, dataset=dataset), dataset)
+    assert stats['records'] == 12
+    assert stats['unique_contaminant_count'] == 1
+    assert stats['most_common_contaminant'] == 'Lead'